@@ -1,108 +1,198 @@
+import argparse
+
 import pandas as pd
 import numpy as np
 
-def analyze_composition_change():
+from metrics import Timeline
+
+# Named eras (inclusive date ranges) compared by default
+ERAS = {
+    '2012-2013': ('2012-04-01', '2013-12-31'),  # The First Cut
+    '2025-2026': ('2025-11-01', '2026-03-01'),  # The Recent Cut
+}
+
+
+def tag_eras(df, eras):
+    """Rows of `df` (sorted by date) that fall in each era, with an `era` column.
+
+    Each era is a slice of the sorted date index found with searchsorted, so
+    tagging dozens of eras costs O(eras log rows). Overlapping eras are fine:
+    a row appears once per era it belongs to.
+    """
+    dates = df['date'].to_numpy()
+    parts = []
+    for name, (start, end) in eras.items():
+        lo = np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), side='left')
+        hi = np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), side='right')
+        parts.append(df.iloc[lo:hi].assign(era=name))
+    tagged = pd.concat(parts, ignore_index=True) if parts else df.iloc[:0].assign(era=None)
+    tagged['era'] = pd.Categorical(tagged['era'], categories=list(eras))
+    return tagged
+
+
+def weight_bins(tagged, bin_width=2.0, value='waist_cm'):
+    """Per-bin statistics of `value` for every era in one pass.
+
+    Weights are assigned to [low, low + bin_width) bins with np.digitize, then a
+    single groupby over (bin, era) gives mean/count. Returns a frame indexed by
+    bin midpoint with one (stat, era) column pair per era.
+    """
+    tagged = tagged.dropna(subset=['weight', value])
+    if tagged.empty:
+        return pd.DataFrame()
+    low = int(tagged['weight'].min())
+    # Enough edges that the heaviest weight falls inside the last bin, even when it sits on an edge
+    edges = low + bin_width * np.arange(int((tagged['weight'].max() - low) // bin_width) + 2)
+    bins = np.digitize(tagged['weight'].to_numpy(), edges) - 1
+    mids = edges[:-1] + bin_width / 2
+    stats = (tagged.groupby([mids[bins], 'era'], observed=False)[value]
+             .agg(['mean', 'count'])
+             .unstack('era'))
+    stats.index.name = 'weight'
+    return stats
+
+
+def nearest_by_weight(reference, weights, k=1, max_gap=np.inf, value='waist_cm'):
+    """Match each of `weights` to the k reference rows with the closest weight.
+
+    `reference` is sorted by weight once; each lookup is a searchsorted plus a
+    look at the k neighbours on either side, instead of a tolerance scan over
+    every row. Neighbours further than `max_gap` kg are ignored. Returns the
+    mean matched `value`, the number of rows matched and the largest weight gap.
+    """
+    reference = reference.dropna(subset=['weight', value]).sort_values('weight', kind='stable')
+    ref_w = reference['weight'].to_numpy()
+    ref_v = reference[value].to_numpy()
+    weights = np.atleast_1d(np.asarray(weights, dtype=np.float64))
+    if len(ref_w) == 0:
+        nan = np.full(len(weights), np.nan)
+        return pd.DataFrame({'weight': weights, value: nan, 'matched': 0, 'gap': nan})
+
+    k = min(k, len(ref_w))
+    pos = np.searchsorted(ref_w, weights)
+    # Candidate window of k rows on each side, clipped to the array
+    window = np.clip(pos[:, None] + np.arange(-k, k)[None, :], 0, len(ref_w) - 1)
+    dist = np.abs(ref_w[window] - weights[:, None])
+    # Clipping can repeat an index; push duplicates to the back before picking k
+    dist[:, 1:][window[:, 1:] == window[:, :-1]] = np.inf
+    best = np.argsort(dist, axis=1, kind='stable')[:, :k]
+    picked = np.take_along_axis(window, best, axis=1)
+    gaps = np.take_along_axis(dist, best, axis=1)
+    ok = gaps <= max_gap
+    matched = ok.sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        return pd.DataFrame({
+            'weight': weights,
+            value: np.where(ok, ref_v[picked], 0).sum(axis=1) / matched,
+            'matched': matched,
+            'gap': np.where(ok, gaps, -np.inf).max(axis=1).clip(min=0),
+        })
+
+
+def analyze_composition_change(eras=None, bin_width=2.0, target_weight=104.7, timeline=None,
+                               tolerance=2.0, nearest=None):
     """
     Analyzes the hypothesis that the user has more muscle mass now due to kettlebells.
     Metric: Waist circumference at equivalent body weights.
     If waist is smaller at the same weight, it implies more lean mass / higher density.
+    Compares the first era against the last one; any number of eras can be tabulated.
+
+    The specific check compares the latest waist measurement with the mean waist
+    of first-era weigh-ins within `tolerance` kg of `target_weight` (the current
+    weight). With `nearest=k`, both eras use their k weigh-ins closest to the
+    target instead (at most `tolerance` kg away).
     """
-    df = pd.read_csv('consolidated_health_data.csv')
-    df['date'] = pd.to_datetime(df['date'])
-    
-    # Define Eras
-    # Era 1: The First Cut (2012 - 2013)
-    era1_start = pd.to_datetime('2012-04-01')
-    era1_end = pd.to_datetime('2013-12-31')
-    
-    # Era 2: The Recent Cut (Nov 2025 - Present)
-    era2_start = pd.to_datetime('2025-11-01')
-    era2_end = pd.to_datetime('2026-03-01')
-    
-    df_era1 = df[(df['date'] >= era1_start) & (df['date'] <= era1_end) & df['weight'].notnull() & df['waist_cm'].notnull()].copy()
-    df_era2 = df[(df['date'] >= era2_start) & (df['date'] <= era2_end) & df['weight'].notnull() & df['waist_cm'].notnull()].copy()
-    
-    df_era1['Era'] = '2012-2013'
-    df_era2['Era'] = '2025-2026'
-    
-    print(f"Era 1 Data Points: {len(df_era1)}")
-    print(f"Era 2 Data Points: {len(df_era2)}")
-    
-    # Compare matching weights
-    # We'll create bins or rounds to matching weights
-    comparison_data = []
-    
-    # Iterate through current era weights and find closest matches in old era
+    eras = eras or ERAS
+    timeline = timeline if timeline is not None else Timeline(columns=['weight', 'waist_cm'])
+    tagged = tag_eras(timeline.measurements, eras)
+    names = list(eras)
+    first, last = names[0], names[-1]
+
+    counts = tagged['era'].value_counts(sort=False)
+    for i, name in enumerate(names, 1):
+        print(f"Era {i} Data Points: {counts[name]}")
+
     print("\n--- Direct Comparisons (Waist size at same Weight) ---")
-    print(f"{'Weight (kg)':<12} | {'2012-13 Waist':<15} | {'2025-26 Waist':<15} | {'Difference':<10}")
-    print("-" * 60)
-    
-    comparison_rows = []
-    
-    # Use bins of 2kg to find overlaps
-    # Bins: 100-102, 102-104, 104-106, etc.
-    min_w = min(df_era1['weight'].min(), df_era2['weight'].min())
-    max_w = max(df_era1['weight'].max(), df_era2['weight'].max())
-    
-    bins = np.arange(int(min_w), int(max_w) + 2, 2)
-    
-    valid_comparisons = 0
-    total_diff = 0
-    
-    for i in range(len(bins)-1):
-        low = bins[i]
-        high = bins[i+1]
-        mid = (low + high) / 2
-        
-        # Get avg waist for this bin
-        w1 = df_era1[(df_era1['weight'] >= low) & (df_era1['weight'] < high)]['waist_cm'].mean()
-        w2 = df_era2[(df_era2['weight'] >= low) & (df_era2['weight'] < high)]['waist_cm'].mean()
-        
-        if pd.notnull(w1) and pd.notnull(w2):
-            diff = w2 - w1
-            print(f"{mid:<12.1f} | {w1:<15.1f} | {w2:<15.1f} | {diff:<10.1f}")
-            valid_comparisons += 1
-            total_diff += diff
-
-    avg_diff = total_diff / valid_comparisons if valid_comparisons > 0 else 0
-    print("-" * 60)
+    header = f"{'Weight (kg)':<12} | " + " | ".join(f"{name + ' Waist':<15}" for name in names)
+    print(header + f" | {'Difference':<10}")
+    print("-" * (len(header) + 12))
+
+    stats = weight_bins(tagged, bin_width)
+    diffs = []
+    if not stats.empty:
+        means = stats['mean']
+        # Bins where the first and last era both have data
+        shared = means[[first, last]].dropna()
+        for mid in shared.index:
+            cells = " | ".join(f"{means.at[mid, n]:<15.1f}" if pd.notnull(means.at[mid, n]) else f"{'-':<15}"
+                               for n in names)
+            diff = shared.at[mid, last] - shared.at[mid, first]
+            diffs.append(diff)
+            print(f"{mid:<12.1f} | {cells} | {diff:<10.1f}")
+
+    avg_diff = float(np.mean(diffs)) if diffs else 0
+    print("-" * (len(header) + 12))
     print(f"Average Difference: {avg_diff:.1f} cm")
-    
-    # 4. Waist to Weight Ratio Analysis
+
+    # Waist to Weight Ratio Analysis
     # Lower is better (less waist per kg of bodyweight)
-    ratio1 = (df_era1['waist_cm'] / df_era1['weight']).mean()
-    ratio2 = (df_era2['waist_cm'] / df_era2['weight']).mean()
-    
+    ratios = (tagged['waist_cm'] / tagged['weight']).groupby(tagged['era'], observed=False).mean()
+
     print("\n--- Waist-to-Weight Ratio (cm/kg) ---")
-    print(f"2012-2013 Average: {ratio1:.3f}")
-    print(f"2025-2026 Average: {ratio2:.3f}")
-    
-    diff_ratio = ratio2 - ratio1
+    for name in names:
+        print(f"{name} Average: {ratios[name]:.3f}")
+
+    diff_ratio = ratios[last] - ratios[first]
     if diff_ratio < 0:
-         print(f"Improvement: Your waist is {abs(diff_ratio):.3f} cm/kg smaller now.")
+        print(f"Improvement: Your waist is {abs(diff_ratio):.3f} cm/kg smaller now.")
+    else:
+        print(f"Change: Your waist is {diff_ratio:.3f} cm/kg larger/similar now.")
+
+    # Specific Reference Point at the target (current) weight
+    measured = tagged.dropna(subset=['weight', 'waist_cm'])
+    if nearest:
+        now = nearest_by_weight(measured[measured['era'] == last], target_weight, nearest, tolerance).iloc[0]
+        then = nearest_by_weight(measured[measured['era'] == first], target_weight, nearest, tolerance).iloc[0]
+        if now['matched'] and then['matched']:
+            print(f"\n--- Specific Check at ~{target_weight}kg ---")
+            print(f"Now ({last}): ~{now['waist_cm']:.1f} cm ({int(now['matched'])} nearest, within {now['gap']:.1f} kg)")
+            print(f"Then ({first}): ~{then['waist_cm']:.1f} cm ({int(then['matched'])} nearest, within {then['gap']:.1f} kg)")
+            print(f"Difference: {now['waist_cm'] - then['waist_cm']:.1f} cm")
     else:
-         print(f"Change: Your waist is {diff_ratio:.3f} cm/kg larger/similar now.")
-
-    # 5. Specific Reference Point (104-105kg)
-    # User is currently ~104.7. Closest 2012 data?
-    target_weight = 104.7
-    tolerance = 2.0
-    
-    closest_2012 = df_era1[
-        (df_era1['weight'] >= target_weight - tolerance) & 
-        (df_era1['weight'] <= target_weight + tolerance)
-    ]
-    
-    if not closest_2012.empty:
-        avg_waist_2012 = closest_2012['waist_cm'].mean()
-        print(f"\n--- Specific Check at ~{target_weight}kg ---")
-        print(f"Now (2026): ~100.5 cm")
-        print(f"Then (2012): ~{avg_waist_2012:.1f} cm (based on matched weights)")
-        print(f"Difference: {100.5 - avg_waist_2012:.1f} cm")
-
-    # Save comparison to sorted DF for detailed report
-    comp_df = pd.DataFrame(comparison_rows)
-    # comp_df.to_csv('waist_comparison.csv', index=False)
+        recent = measured[measured['era'] == last]
+        then = measured[(measured['era'] == first) & (measured['weight'] - target_weight).abs().le(tolerance)]
+        if not recent.empty and not then.empty:
+            latest = recent.iloc[-1]
+            then_waist = then['waist_cm'].mean()
+            print(f"\n--- Specific Check at ~{target_weight}kg ---")
+            print(f"Now ({latest['date'].year}): ~{latest['waist_cm']:.1f} cm")
+            print(f"Then ({pd.Timestamp(eras[first][0]).year}): ~{then_waist:.1f} cm (based on matched weights)")
+            print(f"Difference: {latest['waist_cm'] - then_waist:.1f} cm")
+
+    return stats
+
+
+def parse_era(text):
+    """NAME=START:END, e.g. 'cut-2019=2019-01-01:2019-06-30'."""
+    name, _, span = text.partition('=')
+    start, _, end = span.partition(':')
+    if not (name and start and end):
+        raise argparse.ArgumentTypeError(f"expected NAME=START:END, got {text!r}")
+    return name, (start, end)
+
 
 if __name__ == "__main__":
-    analyze_composition_change()
+    parser = argparse.ArgumentParser(description="Compare waist size at equal body weight across eras.")
+    parser.add_argument('--era', type=parse_era, action='append',
+                        help="era to compare as NAME=START:END (repeatable; default: the 2012 and 2025 cuts)")
+    parser.add_argument('--bin-width', type=float, default=2.0, help="weight bin width in kg (default 2)")
+    parser.add_argument('--target', type=float, default=104.7,
+                        help="current weight for the specific check (default 104.7)")
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help="kg either side of the target a weigh-in may be to match (default 2)")
+    parser.add_argument('--nearest', type=int, metavar='K',
+                        help="compare the K weigh-ins of each era nearest the target instead of the latest "
+                             "measurement against every match within the tolerance")
+    args = parser.parse_args()
+    analyze_composition_change(dict(args.era) if args.era else None, args.bin_width, args.target,
+                               tolerance=args.tolerance, nearest=args.nearest)
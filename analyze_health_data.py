@@ -1,20 +1,15 @@
 import pandas as pd
 import numpy as np
 
-def analyze_health_data():
-    # Load data
-    df = pd.read_csv('consolidated_health_data.csv')
-    df['date'] = pd.to_datetime(df['date'])
-    
-    # User constants
-    HEIGHT_M = 1.83
-    AGE = 44
-    GENDER = 'M'
-    
-    # Calculate derived metrics
-    df['bmi'] = df['weight'] / (HEIGHT_M ** 2)
-    df['whr'] = df['waist_cm'] / df['hips_cm']
-    df['year'] = df['date'].dt.year
+import rolling_stats
+from downsample import minmax
+from health_store import STATS_FILE
+from metrics import Timeline
+
+def analyze_health_data(timeline=None):
+    # Load data (or share the runner's) and the derived metrics
+    timeline = timeline if timeline is not None else Timeline(columns=['weight', 'waist_cm', 'hips_cm'])
+    df = timeline.df.assign(bmi=timeline.bmi, whr=timeline.whr, year=timeline.year)
     
     # 1. Overall Statistics
     print("--- General Statistics ---")
@@ -71,10 +66,23 @@ def analyze_health_data():
     print("\n--- Major Phases Detected ---")
     # Simple low points detection (local minima with window)
     # We can just look at weights min/max per year to see the fluctuation
-    annual_ranges = df.groupby('year')['weight'].agg(['min', 'max', 'mean'])
-    annual_ranges['swing'] = annual_ranges['max'] - annual_ranges['min']
+    # process_health_data.py keeps these up to date in the rolling stats; rescan only without them
+    stats = rolling_stats.load(STATS_FILE)
+    if stats is not None:
+        annual_ranges = pd.DataFrame.from_dict(stats.summary()['yearly'], orient='index')
+        annual_ranges = annual_ranges[['min', 'max', 'mean', 'swing']].rename_axis('year')
+    else:
+        annual_ranges = df.groupby('year')['weight'].agg(['min', 'max', 'mean'])
+        annual_ranges['swing'] = annual_ranges['max'] - annual_ranges['min']
     print("Annual Swings (>5kg years):")
     print(annual_ranges[annual_ranges['swing'] > 5])
 
+    # Turning points: min-max downsampling keeps the peak and trough of every
+    # half-year bucket, so yo-yo cycles show up as alternating highs and lows
+    weights = timeline.weights
+    idx = minmax(weights['date'].map(pd.Timestamp.toordinal), weights['weight'], 4 * df['year'].nunique() + 2)
+    print("\nTurning Points (half-yearly highs/lows):")
+    print(weights.iloc[idx][['date', 'weight']].to_string(index=False))
+
 if __name__ == "__main__":
     analyze_health_data()
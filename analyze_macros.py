@@ -1,27 +1,19 @@
-import pandas as pd
-import numpy as np
+import rolling_stats
+from health_store import STATS_FILE
+from metrics import TARGET_CALORIES, TARGET_PROTEIN, Timeline
 
-def analyze_macros():
-    # Load data
-    df = pd.read_csv('consolidated_health_data.csv')
-    df['date'] = pd.to_datetime(df['date'])
+def analyze_macros(timeline=None):
+    # Load data (or share the runner's); metrics are already numeric
+    timeline = timeline if timeline is not None else Timeline(columns=['calories', 'protein_g', 'weight'])
     
     # Filter for data with macros (Recent era)
-    # Ensure numeric types
-    for col in ['calories', 'protein_g']:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
     # We only have macros in the recent logs
-    macro_df = df.dropna(subset=['calories']).copy()
+    macro_df = timeline.macros
     
     if macro_df.empty:
         print("No macro data found.")
         return
 
-    # Targets
-    TARGET_CALORIES = 2400
-    TARGET_PROTEIN = 180
-    
     # 1. Adherence Stats
     avg_cals = macro_df['calories'].mean()
     avg_protein = macro_df['protein_g'].mean()
@@ -44,27 +36,22 @@ def analyze_macros():
         (macro_df['protein_g'] >= TARGET_PROTEIN)
     ]
     print(f"Perfect Days (Hit Both): {len(perfect_days)} ({len(perfect_days)/days_tracked*100:.1f}%)")
+
+    # Rolling means and trend weight are precomputed by process_health_data.py
+    stats = rolling_stats.load(STATS_FILE)
+    if stats is not None:
+        summary = stats.summary()
+        rolling = summary['rolling']
+        print(f"\n--- Rolling Averages (as of {summary['as_of']}) ---")
+        print(f"Calories: {rolling['calories']['7d']} (7-day) | {rolling['calories']['28d']} (28-day)")
+        print(f"Protein: {rolling['protein_g']['7d']}g (7-day) | {rolling['protein_g']['28d']}g (28-day)")
+        print(f"Trend Weight: {summary['trend_weight']}kg (latest {summary['latest_weight']}kg)")
     
     # 3. Impact Analysis
     # We want to see if weeks with better adherence had better weight results.
     # Weight tracking isn't daily in recent logs (some gaps), so we'll resample to weekly.
     
-    # First, ensure we have a continuous date range for the recent period
-    start_date = macro_df['date'].min()
-    end_date = macro_df['date'].max()
-    
-    # Resample to weekly
-    # Set date as index
-    macro_df.set_index('date', inplace=True)
-    
-    weekly = macro_df.resample('W').agg({
-        'calories': 'mean',
-        'protein_g': 'mean',
-        'weight': 'last' # Weight at end of week
-    })
-    
-    # Calculate weekly weight change
-    weekly['weight_change'] = weekly['weight'].diff()
+    weekly = timeline.weekly_macros
     
     print("\n--- Weekly Trends ---")
     print(weekly[['calories', 'protein_g', 'weight', 'weight_change']].round(1))
@@ -77,8 +64,8 @@ def analyze_macros():
 
     # 5. Protein Density (Protein/Cals * 100) -> % of cals from protein ideally? 
     # Or just g/100kcal.
-    macro_df['protein_density'] = macro_df['protein_g'] / (macro_df['calories'] / 100)
-    print(f"Avg Protein Density: {macro_df['protein_density'].mean():.1f}g per 100kcal")
+    protein_density = macro_df['protein_g'] / (macro_df['calories'] / 100)
+    print(f"Avg Protein Density: {protein_density.mean():.1f}g per 100kcal")
 
 if __name__ == "__main__":
     analyze_macros()
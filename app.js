@@ -1,7 +1,23 @@
 // HealthOS v2 — Core Logic
 
-const STORAGE_KEY = 'healthos_data_v2';
+// Multi-user servers: open the app once with ?user=<key>; the key is remembered, sent
+// with every API call, and the local copy is kept per user (?user= clears it)
+const USER_KEY = (() => {
+    const fromUrl = new URLSearchParams(location.search).get('user');
+    if (fromUrl !== null) localStorage.setItem('healthos_user', fromUrl);
+    return localStorage.getItem('healthos_user') || '';
+})();
+const USER_SUFFIX = USER_KEY ? `:${USER_KEY}` : '';
+
+const STORAGE_KEY = 'healthos_data_v2' + USER_SUFFIX;
+const REVISION_KEY = 'healthos_revision' + USER_SUFFIX;
+// Edits not yet pushed ({dates, full}), so they survive a reload or a closed tab
+const PENDING_KEY = 'healthos_pending' + USER_SUFFIX;
+// Tries per push before giving up on repeated conflicts (the next edit retries)
+const MAX_PUSH_ATTEMPTS = 3;
 const DATA_FILE = './data.json';
+// Days fetched first on a new device, so the dashboard renders before the full history
+const RECENT_DAYS = 90;
 
 // API base: auto-detect (same origin when deployed, or explicit for dev)
 // For static hosting (GitHub Pages): '' (empty = same origin)
@@ -42,28 +58,106 @@ function fmtDate(dateStr) {
 
 function $(id) { return document.getElementById(id); }
 
+// Every API call goes through here so it is routed to this user's data
+function apiFetch(path, options = {}) {
+    const headers = { ...(options.headers || {}) };
+    if (USER_KEY) headers['X-HealthOS-User'] = USER_KEY;
+    return fetch(`${API_BASE}${path}`, { ...options, headers });
+}
+
+// Seed/server data carries full ISO timestamps; the app keys entries by YYYY-MM-DD
+function normDate(dateStr) { return dateStr.split('T')[0]; }
+
+// ─── Columnar wire format ───────────────────────────────────
+// Entry lists are requested in the server's columnar format (see columnar.py):
+// one array per field with null runs dropped and dates as day offsets.
+
+const COLUMNAR_TYPE = 'application/vnd.healthos.columnar+json';
+const ENTRIES_ACCEPT = `${COLUMNAR_TYPE}, application/json;q=0.9`;
+
+function decodeColumnar(doc) {
+    const entries = [];
+    let day = doc.epoch ? Date.parse(doc.epoch + 'T00:00:00Z') : 0;
+    doc.days.forEach(offset => {
+        day += offset * 86400000;
+        entries.push({ date: new Date(day).toISOString().slice(0, 10) });
+    });
+    Object.entries(doc.columns).forEach(([field, { runs, values }]) => {
+        let row = 0, v = 0;
+        for (let i = 0; i < runs.length; i += 2) {
+            row += runs[i];
+            for (const end = row + runs[i + 1]; row < end; row++) entries[row][field] = values[v++];
+        }
+    });
+    return entries;
+}
+
+// Entries from a GET /api/data response in either format
+async function readEntries(res) {
+    const body = await res.json();
+    return (res.headers.get('Content-Type') || '').startsWith(COLUMNAR_TYPE) ? decodeColumnar(body) : body;
+}
+
 // ─── Server Sync ────────────────────────────────────────────
 
 const ServerSync = {
+    // Server revision we are in sync with; lets pull() fetch only newer entries
+    revision: parseInt(localStorage.getItem(REVISION_KEY)) || 0,
+    // Dates edited locally since the last push (sent via PATCH); fullPush forces a PUT of everything
+    dirtyDates: new Set(),
+    fullPush: false,
+
+    setRevision(rev) {
+        if (rev == null || isNaN(rev)) return;
+        this.revision = rev;
+        localStorage.setItem(REVISION_KEY, String(rev));
+    },
+
+    get hasPending() {
+        return this.fullPush || this.dirtyDates.size > 0;
+    },
+
+    loadPending() {
+        try {
+            const pending = JSON.parse(localStorage.getItem(PENDING_KEY)) || {};
+            this.dirtyDates = new Set(pending.dates || []);
+            this.fullPush = !!pending.full;
+        } catch (e) {
+            console.warn('[HealthOS] Unreadable pending edits, dropping them', e);
+        }
+    },
+
+    savePending() {
+        if (this.hasPending) {
+            localStorage.setItem(PENDING_KEY, JSON.stringify({ dates: [...this.dirtyDates], full: this.fullPush }));
+        } else {
+            localStorage.removeItem(PENDING_KEY);
+        }
+    },
+
     async pull() {
         try {
             updateSyncUI('syncing', 'Pulling...');
-            const res = await fetch(`${API_BASE}/api/data`);
+            if (this.revision && healthData.length) {
+                return await this.pullChanges();
+            }
+            const res = await apiFetch('/api/data', { headers: { Accept: ENTRIES_ACCEPT } });
             if (!res.ok) throw new Error(`HTTP ${res.status}`);
-            const serverData = await res.json();
+            const serverData = await readEntries(res);
             if (Array.isArray(serverData) && serverData.length > 0) {
                 // Merge: server is source of truth, but keep any local-only entries
                 const serverMap = {};
-                serverData.forEach(d => { serverMap[d.date] = d; });
+                serverData.forEach(d => { serverMap[normDate(d.date)] = { ...d, date: normDate(d.date) }; });
 
-                // Add local entries not on server
+                // Add local entries not on server, and local edits not pushed yet
                 healthData.forEach(d => {
-                    if (!serverMap[d.date]) serverMap[d.date] = d;
+                    if (!serverMap[d.date] || this.dirtyDates.has(d.date)) serverMap[d.date] = d;
                 });
 
                 healthData = Object.values(serverMap);
                 healthData.sort((a, b) => a.date.localeCompare(b.date));
                 localStorage.setItem(STORAGE_KEY, JSON.stringify(healthData));
+                this.setRevision(parseInt(res.headers.get('X-HealthOS-Revision')));
                 console.log(`[HealthOS] Pulled ${serverData.length} entries from server`);
                 lastSyncTime = new Date();
                 updateSyncUI('ok', fmtTime(lastSyncTime));
@@ -76,16 +170,86 @@ const ServerSync = {
         return false;
     },
 
-    async push() {
+    // First load with no local copy: just the recent window (?from=), no revision yet
+    async pullRecent(days = RECENT_DAYS) {
+        const from = new Date(Date.now() - days * 86400000).toISOString().slice(0, 10);
+        try {
+            const res = await apiFetch(`/api/data?from=${from}`, { headers: { Accept: ENTRIES_ACCEPT } });
+            if (!res.ok) return false;
+            const recent = await readEntries(res);
+            if (!Array.isArray(recent) || !recent.length) return false;
+            healthData = recent.map(d => ({ ...d, date: normDate(d.date) }));
+            console.log(`[HealthOS] Pulled ${recent.length} recent entries from server`);
+            return true;
+        } catch (e) {
+            return false;
+        }
+    },
+
+    async pullChanges() {
+        const res = await apiFetch(`/api/data?since=${this.revision}`);
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const delta = await res.json();
+
+        const byDate = {};
+        // A full answer (the server's data was replaced) is the whole dataset: keep only unpushed edits
+        healthData.forEach(d => { if (!delta.full || this.dirtyDates.has(d.date)) byDate[d.date] = d; });
+        delta.entries.forEach(d => {
+            const date = normDate(d.date);
+            // Local edits not yet pushed win over the server copy
+            if (!this.dirtyDates.has(date)) byDate[date] = { ...d, date };
+        });
+        delta.deleted.forEach(date => {
+            if (!this.dirtyDates.has(date)) delete byDate[date];
+        });
+
+        healthData = Object.values(byDate);
+        healthData.sort((a, b) => a.date.localeCompare(b.date));
+        localStorage.setItem(STORAGE_KEY, JSON.stringify(healthData));
+        this.setRevision(delta.revision);
+        console.log(`[HealthOS] Pulled ${delta.entries.length} changed entries from server (rev ${delta.revision})`);
+        lastSyncTime = new Date();
+        updateSyncUI('ok', fmtTime(lastSyncTime));
+        return true;
+    },
+
+    // Writes are conditional on the revision we last saw (If-Match). If someone else
+    // changed the same dates since, the server answers 409 with just those dates:
+    // fold them in (our unpushed fields win), catch up, and try again.
+    async push(attempt = 1) {
         try {
             updateSyncUI('syncing', 'Saving...');
-            const res = await fetch(`${API_BASE}/api/data`, {
-                method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(healthData)
-            });
+            const headers = { 'Content-Type': 'application/json' };
+            if (this.revision) headers['If-Match'] = `"r${this.revision}"`;
+            let res;
+            const dates = [...this.dirtyDates];
+            if (this.fullPush) {
+                res = await apiFetch('/api/data', {
+                    method: 'PUT',
+                    headers,
+                    body: JSON.stringify(healthData)
+                });
+            } else {
+                const entries = healthData.filter(d => this.dirtyDates.has(d.date));
+                res = await apiFetch('/api/data', {
+                    method: 'PATCH',
+                    headers,
+                    body: JSON.stringify(entries)
+                });
+            }
+            if (res.status === 409 && attempt < MAX_PUSH_ATTEMPTS) {
+                this.reconcile((await res.json()).conflicts);
+                await this.pullChanges();
+                return await this.push(attempt + 1);
+            }
             if (!res.ok) throw new Error(`HTTP ${res.status}`);
+            // A full PUT carried these dates too; edits made while the push was in flight stay dirty
+            dates.forEach(d => this.dirtyDates.delete(d));
+            this.fullPush = false;
+            this.savePending();
             const result = await res.json();
+            // Nobody else wrote in between: we're in sync with the write we just made
+            if (result.revision === this.revision + 1) this.setRevision(result.revision);
             lastSyncTime = new Date();
             updateSyncUI('ok', fmtTime(lastSyncTime));
             console.log(`[HealthOS] Pushed ${result.count} entries to server`);
@@ -97,7 +261,28 @@ const ServerSync = {
         }
     },
 
-    schedulePush() {
+    // Merge the server's copy of conflicting dates into ours, field by field
+    reconcile(conflicts) {
+        const byDate = {};
+        healthData.forEach(d => { byDate[d.date] = d; });
+        conflicts.entries.forEach(d => {
+            const date = normDate(d.date);
+            const local = byDate[date];
+            byDate[date] = local && this.dirtyDates.has(date) ? { ...d, ...local, date } : { ...d, date };
+        });
+        conflicts.deleted.forEach(date => {
+            if (!this.dirtyDates.has(date)) delete byDate[date];
+        });
+        healthData = Object.values(byDate);
+        healthData.sort((a, b) => a.date.localeCompare(b.date));
+        localStorage.setItem(STORAGE_KEY, JSON.stringify(healthData));
+        console.log(`[HealthOS] Reconciled ${conflicts.entries.length + conflicts.deleted.length} conflicting dates`);
+    },
+
+    schedulePush(dates) {
+        if (dates) dates.forEach(d => this.dirtyDates.add(d));
+        else this.fullPush = true;
+        this.savePending();
         if (syncTimer) clearTimeout(syncTimer);
         syncTimer = setTimeout(() => ServerSync.push(), 2000);
     }
@@ -127,6 +312,13 @@ function fmtTime(d) {
 // ─── Init ───────────────────────────────────────────────────
 
 async function init() {
+    ServerSync.loadPending();
+    // With a known server revision, start from the local copy and pull only what changed;
+    // on a new device, render the last RECENT_DAYS first while the full history loads
+    if (ServerSync.revision || ServerSync.hasPending) await loadLocalData();
+    else if (await ServerSync.pullRecent()) render();
+    // Edits left unpushed by an earlier session (offline, or the tab closed) go up before we pull
+    if (ServerSync.hasPending) await ServerSync.push();
     // Try server first, fall back to local
     const serverOk = await ServerSync.pull();
     if (!serverOk || !healthData.length) {
@@ -179,9 +371,9 @@ async function loadLocalData() {
     console.log(`[HealthOS] Total entries: ${healthData.length}, weight entries: ${healthData.filter(d => d.weight).length}`);
 }
 
-function persist() {
+function persist(changedDates) {
     localStorage.setItem(STORAGE_KEY, JSON.stringify(healthData));
-    ServerSync.schedulePush();
+    ServerSync.schedulePush(changedDates);
 }
 
 // ─── Render All ─────────────────────────────────────────────
@@ -198,6 +390,7 @@ function render() {
     renderTrendChart(weightEntries, waistEntries);
     renderWaistChart(waistEntries);
     renderHistoricalChart();
+    renderLeanChart();
     renderHistory();
 }
 
@@ -277,6 +470,23 @@ function renderMacros() {
 
     $('avgCals').textContent = Math.round(totalCals / logs.length).toLocaleString();
     $('avgProtein').textContent = Math.round(totalProt / logs.length) + 'g';
+
+    // When in sync with the server, show its precomputed means (same last-7-logs definition)
+    renderServerMacros();
+}
+
+async function renderServerMacros() {
+    if (!lastSyncTime || ServerSync.hasPending) return;
+    try {
+        const res = await apiFetch('/api/stats');
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const { recent_logs: recent } = await res.json();
+        if (!recent || !recent.days) return;
+        $('avgCals').textContent = Math.round(recent.calories).toLocaleString();
+        $('avgProtein').textContent = Math.round(recent.protein_g) + 'g';
+    } catch (e) {
+        console.warn('[HealthOS] Stats fetch failed, using local averages', e.message);
+    }
 }
 
 // ─── Trend Chart (Weight only) ──────────────────────────────
@@ -488,13 +698,32 @@ function renderWaistChart(waistEntries) {
 
 let historicalChart = null;
 
-function renderHistoricalChart() {
+// Aggregated or downsampled points from the backend; null when there is no server to ask
+async function fetchSeries(params) {
+    if (!lastSyncTime) return null;
+    try {
+        const res = await apiFetch(`/api/series?${new URLSearchParams(params)}`);
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        return (await res.json()).points;
+    } catch (e) {
+        console.warn('[HealthOS] Series fetch failed, using local data', e.message);
+        return null;
+    }
+}
+
+async function renderHistoricalChart() {
     const ctx = $('historicalChart').getContext('2d');
     
-    // Get all weight entries from 2012 onwards
-    const weightEntries = healthData
-        .filter(d => d.weight && d.date >= '2012-01-01')
-        .sort((a, b) => a.date.localeCompare(b.date));
+    // The server downsamples (LTTB) to about one point per pixel, keeping the peaks and
+    // troughs; without a backend, fall back to every local weight entry from 2012 onwards
+    const series = await fetchSeries({
+        metric: 'weight', bucket: 'none', from: '2012-01-01', width: ctx.canvas.clientWidth || 500
+    });
+    const weightEntries = series
+        ? series.map(p => ({ date: p.date, weight: p.value }))
+        : healthData
+            .filter(d => d.weight && d.date >= '2012-01-01')
+            .sort((a, b) => a.date.localeCompare(b.date));
     
     if (!weightEntries.length) return;
     
@@ -575,6 +804,87 @@ function renderHistoricalChart() {
     });
 }
 
+// ─── Lean Mass Chart ────────────────────────────────────────
+
+let leanChart = null;
+
+// BF% and lean mass are estimated server-side (Navy formula over every entry with
+// weight and waist, cached per revision); the card stays hidden without a backend
+async function renderLeanChart() {
+    if (!lastSyncTime) return;
+    let points;
+    try {
+        const res = await apiFetch('/api/bodyfat');
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        points = (await res.json()).points;
+    } catch (e) {
+        console.warn('[HealthOS] Body fat fetch failed', e.message);
+        return;
+    }
+    if (!points.length) return;
+    $('leanCard').style.display = '';
+
+    const ctx = $('leanChart').getContext('2d');
+    if (leanChart) leanChart.destroy();
+
+    leanChart = new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: points.map(p => p.date.slice(0, 7)),
+            datasets: [{
+                label: 'Lean mass (kg)',
+                data: points.map(p => p.lean_mass),
+                borderColor: '#10b981',
+                backgroundColor: 'rgba(16,185,129,0.08)',
+                borderWidth: 2,
+                tension: 0.3,
+                pointRadius: 1.5,
+                pointBackgroundColor: '#10b981',
+                fill: true
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: { display: false },
+                tooltip: {
+                    backgroundColor: '#1e293b',
+                    borderColor: '#334155',
+                    borderWidth: 1,
+                    titleColor: '#f1f5f9',
+                    bodyColor: '#94a3b8',
+                    padding: 10,
+                    cornerRadius: 8,
+                    callbacks: {
+                        title: context => points[context[0].dataIndex].date,
+                        afterLabel: context => `Body fat: ${points[context.dataIndex].body_fat}%`
+                    }
+                }
+            },
+            scales: {
+                y: {
+                    grid: { color: 'rgba(51,65,85,0.5)', lineWidth: 0.5 },
+                    ticks: {
+                        color: '#64748b',
+                        font: { size: 10 },
+                        callback: v => v + 'kg'
+                    }
+                },
+                x: {
+                    grid: { display: false },
+                    ticks: {
+                        color: '#475569',
+                        font: { size: 9 },
+                        maxRotation: 45,
+                        maxTicksLimit: 12
+                    }
+                }
+            }
+        }
+    });
+}
+
 // ─── History / Log Viewer ───────────────────────────────────
 
 function renderHistory() {
@@ -653,7 +963,7 @@ function setupListeners() {
         }
 
         healthData.sort((a, b) => a.date.localeCompare(b.date));
-        persist();
+        persist([entry.date]);
         render();
 
         $('logModal').classList.remove('open');
@@ -0,0 +1,297 @@
+"""Benchmarks for ingestion, consolidation, the analysis reports and the API.
+
+    python benchmark.py                          # 10x, 100x and 1000x, print timings
+    python benchmark.py --scales 10,100          # a subset
+    python benchmark.py --save baseline.json     # record a baseline
+    python benchmark.py --compare baseline.json  # compare against it (exit 1 on a regression)
+
+The real history is on the order of BASE_ROWS rows, so each scale generates
+synthetic raw exports with scale x BASE_ROWS days in total: users with
+multi-decade daily histories (DAYS_PER_USER each), written in the same TSV
+layouts as the real exports. Then it times:
+
+    pipeline.parse        parse_weight_file + parse_measurements_file + parse_daily_logs
+    pipeline.consolidate  consolidate() of the parsed frames
+    report.<name>         each run_reports.REPORTS main function on a fresh Timeline
+    api.boot              server.warm_up() over the users' partitions
+    api.get_data          GET /api/data (gzip), per request
+    api.put_data          PUT /api/data of a user's entries with one day edited, per request
+    api.health            GET /api/health, per request
+
+Pipeline and report timings are totals over all users; each is the best of
+--repeat runs. The API runs in a fresh process per scale, so api.boot is a
+real cold start.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from metrics import REPORT_COLUMNS, Timeline
+from process_health_data import consolidate, parse_daily_logs, parse_measurements_file, parse_weight_file
+from run_reports import REPORTS
+from storage import write_data
+
+# Rows in the real consolidated history, roughly; scale 1 is this size
+BASE_ROWS = 1000
+# ~27 years of daily history per synthetic user
+DAYS_PER_USER = 10_000
+LAST_DAY = date(2026, 2, 13)
+SCALES = (10, 100, 1000)
+# A timing this much slower than the baseline (and by at least MIN_DELTA s) is a regression
+THRESHOLD = 1.25
+MIN_DELTA = 0.002
+
+
+# ─── Synthetic data ──────────────────────────────────────────
+
+def fmt_day(day):
+    return day.strftime('%d/%m/%Y')
+
+
+def fmt_value(value):
+    return '' if np.isnan(value) else f'{value:.1f}'
+
+
+def write_user_exports(directory, seed, days=DAYS_PER_USER):
+    """Raw weight, measurement and daily-log exports for one synthetic user.
+
+    Weight is a random walk logged on most days; measurements are weekly; the
+    last fifth of the history also has a detailed daily log whose weights
+    overlap the weight history, so the merge resolves real conflicts.
+    Returns {'weight': path, 'measurements': path, 'daily_log': path}.
+    """
+    rng = np.random.default_rng(seed)
+    dates = [LAST_DAY - timedelta(days=days - 1 - i) for i in range(days)]
+    weight = np.clip(rng.uniform(80, 110) + np.cumsum(rng.normal(0, 0.15, days)), 60, 160)
+    noisy = weight + rng.normal(0, 0.4, days)
+    waist = 0.55 * weight + 45 + rng.normal(0, 0.8, days)
+    hips = 0.3 * weight + 75 + rng.normal(0, 0.8, days)
+    paths = {name: os.path.join(directory, f'{name}.txt') for name in ('weight', 'measurements', 'daily_log')}
+
+    lines = ['Date\tWeight (kg)\tNotes']
+    for i in np.flatnonzero(rng.random(days) < 0.85):
+        note = str(dates[i].year) if dates[i].timetuple().tm_yday == 1 else ''
+        lines.append(f'{fmt_day(dates[i])}\t{noisy[i]:.1f}\t{note}')
+    with open(paths['weight'], 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    lines = ['Measurements', '', 'Date\tWaist (cm)\tHips (cm)\tBiceps (L)\tBiceps (R)\tNotes']
+    for i in range(days % 7, days, 7):
+        # Now and then an approximate reading, which the parser drops
+        waist_text = f'~{waist[i]:.0f}' if rng.random() < 0.02 else f'{waist[i]:.1f}'
+        lines.append(f'{fmt_day(dates[i])}\t{waist_text}\t{hips[i]:.1f}\t{weight[i] * 0.35:.0f}\t\t')
+    with open(paths['measurements'], 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    lines = ['Date\tCalories\tProtein (g)\tCarbs (g)\tFat (g)\tWeight (kg)\tWaist (cm)\tHips (cm)']
+    for i in range(days - days // 5, days):
+        calories = int(rng.normal(2400, 250))
+        measured = rng.random() < 0.3
+        lines.append('\t'.join([
+            fmt_day(dates[i]), f'"{calories:,}"', str(int(rng.normal(180, 15))), '200', '80', f'{noisy[i]:.1f}',
+            fmt_value(waist[i] if measured else np.nan), fmt_value(hips[i] if measured else np.nan)]))
+    with open(paths['daily_log'], 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return paths
+
+
+def to_entries(consolidated):
+    """API entries (as in data.json, nulls dropped) from a consolidated frame."""
+    columns = ['date', 'weight', 'notes', 'type'] + [c for c in REPORT_COLUMNS if c != 'weight']
+    frame = consolidated[columns].astype(object).where(consolidated[columns].notna(), None)
+    frame['date'] = consolidated['date'].dt.strftime('%Y-%m-%d')
+    return [{k: v for k, v in row.items() if v is not None} for row in frame.to_dict('records')]
+
+
+# ─── Timing ──────────────────────────────────────────────────
+
+def best_of(repeat, fn):
+    """Fastest of `repeat` calls of fn(), in seconds (and the last result)."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def per_request(repeat, keys, request):
+    """Mean seconds per request of the fastest pass calling request(key) for every key."""
+    def one_pass():
+        for key in keys:
+            response = request(key)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{response.status_code} for {key}: {response.get_data(as_text=True)[:200]}')
+    return best_of(repeat, one_pass)[0] / len(keys)
+
+
+def time_pipeline(exports, repeat):
+    """Parse + consolidate every user's exports; returns timings and the consolidated frames."""
+    def parse():
+        return [(parse_weight_file(p['weight']), parse_measurements_file(p['measurements']),
+                 parse_daily_logs(p['daily_log'])) for p in exports]
+
+    parse_time, parsed = best_of(repeat, parse)
+    consolidate_time, frames = best_of(repeat, lambda: [consolidate(list(frames)) for frames in parsed])
+    return {'pipeline.parse': parse_time, 'pipeline.consolidate': consolidate_time}, frames
+
+
+def time_reports(frames, repeat):
+    timings = {}
+    for name, (_, report) in REPORTS.items():
+        def run():
+            with redirect_stdout(io.StringIO()):
+                for frame in frames:
+                    report(Timeline(df=frame[['date'] + REPORT_COLUMNS]))
+        timings[f'report.{name}'] = best_of(repeat, run)[0]
+    return timings
+
+
+def time_api(data_dir, keys, repeat):
+    """API timings against the partitions in data_dir; runs in its own process."""
+    os.environ['DATA_DIR'] = data_dir
+    with redirect_stdout(io.StringIO()):
+        import server
+        start = time.perf_counter()
+        server.warm_up()
+        timings = {'api.boot': time.perf_counter() - start}
+
+    client = server.app.test_client()
+    user = lambda key, **headers: {server.USER_HEADER: key, **headers}
+    timings['api.get_data'] = per_request(
+        repeat, keys, lambda key: client.get('/api/data', headers=user(key, **{'Accept-Encoding': 'gzip'})))
+
+    stored = {key: client.get('/api/data', headers=user(key)).get_json() for key in keys}
+    def put(key):
+        entries = stored[key]
+        entries[-1]['weight'] = round(entries[-1].get('weight', 100.0) + 0.1, 1)
+        return client.put('/api/data', json=entries, headers=user(key))
+    timings['api.put_data'] = per_request(repeat, keys, put)
+    timings['api.health'] = per_request(repeat, keys, lambda key: client.get('/api/health', headers=user(key)))
+    return timings
+
+
+def run_scale(scale, workdir, repeat):
+    users = max(1, scale * BASE_ROWS // DAYS_PER_USER)
+    keys = [f'bench-{scale}x-{i}' for i in range(users)]
+    exports = []
+    for i, key in enumerate(keys):
+        directory = os.path.join(workdir, 'raw', key)
+        os.makedirs(directory)
+        exports.append(write_user_exports(directory, seed=scale * 1000 + i))
+
+    timings, frames = time_pipeline(exports, repeat)
+    timings.update(time_reports(frames, repeat))
+
+    data_dir = os.path.join(workdir, f'data-{scale}x')
+    for key, frame in zip(keys, frames):
+        partition = os.path.join(data_dir, 'users', key)
+        os.makedirs(partition)
+        write_data(os.path.join(partition, 'healthos_data.json'), to_entries(frame))
+    # A fresh interpreter per scale: a cold start, and DATA_DIR is read at import
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        timings.update(pool.submit(time_api, data_dir, keys, repeat).result())
+    return {'users': users, 'rows': int(sum(len(f) for f in frames)), 'timings': timings}
+
+
+def run_benchmarks(scales=SCALES, repeat=3):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='healthos-bench-') as workdir:
+        cwd = os.getcwd()
+        # Reports look for consolidated/stats.json relative to the cwd; don't pick up the real one
+        os.chdir(workdir)
+        try:
+            for scale in scales:
+                start = time.perf_counter()
+                results[f'{scale}x'] = run_scale(scale, workdir, repeat)
+                print(f'{scale}x: {results[f"{scale}x"]["rows"]:,} rows in {time.perf_counter() - start:.1f}s',
+                      file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': f'{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs',
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+# ─── Reporting ───────────────────────────────────────────────
+
+def fmt_seconds(seconds):
+    return f'{seconds * 1000:.2f}ms' if seconds < 1 else f'{seconds:.2f}s'
+
+
+def print_results(run):
+    print(f"{run['created']}  Python {run['python']}  {run['machine']}  best of {run['repeat']}")
+    for scale, result in run['results'].items():
+        print(f"\n{scale}: {result['users']} user(s), {result['rows']:,} rows")
+        for name, seconds in result['timings'].items():
+            print(f'  {name:<22} {fmt_seconds(seconds):>10}')
+
+
+def compare(baseline, run, threshold=THRESHOLD):
+    """Print current vs baseline timings; returns the regressions as (scale, name, ratio)."""
+    regressions = []
+    print(f"\nCompared with the baseline from {baseline['created']} (Python {baseline['python']}, "
+          f"{baseline['machine']}):")
+    for scale, result in run['results'].items():
+        old = baseline['results'].get(scale)
+        if old is None:
+            continue
+        print(f'\n{scale}:')
+        for name, seconds in result['timings'].items():
+            before = old['timings'].get(name)
+            if before is None:
+                continue
+            ratio = seconds / before if before else float('inf')
+            regressed = ratio > threshold and seconds - before > MIN_DELTA
+            if regressed:
+                regressions.append((scale, name, ratio))
+            print(f'  {name:<22} {fmt_seconds(before):>10} -> {fmt_seconds(seconds):>10}  '
+                  f'{ratio:5.2f}x{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, reports and the API on synthetic data.")
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)),
+                        help="comma-separated multiples of the real history's size (default: 10,100,1000)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per timing, the best is kept (default: 3)")
+    parser.add_argument('--save', metavar='PATH', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="compare with a saved baseline; exit 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"slowdown ratio that counts as a regression (default: {THRESHOLD})")
+    args = parser.parse_args()
+    try:
+        scales = [int(s) for s in args.scales.split(',')]
+    except ValueError:
+        parser.error('--scales expects comma-separated integers, e.g. 10,100')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    run = run_benchmarks(scales, max(1, args.repeat))
+    print_results(run)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'\nSaved to {args.save}')
+    if baseline is not None:
+        regressions = compare(baseline, run, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) over {args.threshold}x')
+            sys.exit(1)
@@ -0,0 +1,82 @@
+"""Columnar wire format for entry lists (application/vnd.healthos.columnar+json).
+
+Entries repeat every key and most values are null, so the row format is
+mostly key names and nulls. The columnar document stores one array per field
+and drops the nulls:
+
+    {
+      "format": "columnar-v1",
+      "epoch": "2012-05-23",          first date
+      "days": [0, 16, 1, 1, ...],     day offset of each entry from the previous one
+      "columns": {
+        "weight": {"runs": [0, 3, 2, 1], "values": [103.0, 100.0, 99.5, 98.7]},
+        ...
+      }
+    }
+
+`runs` alternates (nulls to skip, values present): [0, 3, 2, 1] means rows
+0-2 have a value, rows 3-4 don't, row 5 does. Fields that are missing or null
+in an entry are absent after decoding. Dates are normalised to YYYY-MM-DD.
+"""
+from datetime import date
+
+from storage import date_key
+
+MIMETYPE = 'application/vnd.healthos.columnar+json'
+FORMAT = 'columnar-v1'
+
+
+def _runs(indices):
+    """Alternating (skip, take) counts for sorted row indices."""
+    runs = []
+    end = 0  # row after the last run
+    for i in indices:
+        if runs and i == end:
+            runs[-1] += 1
+        else:
+            runs += [i - end, 1]
+        end = i + 1
+    return runs
+
+
+def encode(entries):
+    """Columnar document for date-sorted entries."""
+    ordinals = [date.fromisoformat(date_key(e)).toordinal() for e in entries]
+    days = [b - a for a, b in zip(ordinals[:1] + ordinals, ordinals)]
+
+    present = {}  # field -> (row indices, values)
+    for i, entry in enumerate(entries):
+        for field, value in entry.items():
+            if field != 'date' and value is not None:
+                rows, values = present.setdefault(field, ([], []))
+                rows.append(i)
+                values.append(value)
+
+    return {
+        'format': FORMAT,
+        'epoch': date.fromordinal(ordinals[0]).isoformat() if entries else None,
+        'days': days,
+        'columns': {f: {'runs': _runs(rows), 'values': values} for f, (rows, values) in present.items()},
+    }
+
+
+def decode(doc):
+    """Entries back from a columnar document (the inverse of encode, minus nulls)."""
+    if doc.get('format') != FORMAT:
+        raise ValueError(f"Unsupported format {doc.get('format')!r}")
+    entries = []
+    if doc['days']:
+        day = date.fromisoformat(doc['epoch']).toordinal()
+        for offset in doc['days']:
+            day += offset
+            entries.append({'date': date.fromordinal(day).isoformat()})
+    for field, column in doc['columns'].items():
+        values = iter(column['values'])
+        row = 0
+        runs = column['runs']
+        for skip, take in zip(runs[::2], runs[1::2]):
+            row += skip
+            for entry in entries[row:row + take]:
+                entry[field] = next(values)
+            row += take
+    return entries
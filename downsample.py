@@ -0,0 +1,84 @@
+"""Time-series downsampling for charts: LTTB and min-max per bucket.
+
+Both functions take x (e.g. date ordinals) and y as 1-D arrays sorted by x and
+return the *indices* of the points to keep, so callers can pick dates, labels
+or whole entries with them. The first and last points are always kept.
+
+    idx = lttb(x, y, 400)
+    x_small, y_small = x[idx], y[idx]
+"""
+import numpy as np
+
+
+def _as_arrays(x, y):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.shape != y.shape or x.ndim != 1:
+        raise ValueError('x and y must be 1-D arrays of the same length')
+    return x, y
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: keeps the points that carry the visual shape.
+
+    The interior points are split into n_out - 2 buckets; from each bucket we keep
+    the point forming the largest triangle with the previously kept point and
+    the mean of the next bucket. Bucket means are computed up front with
+    reduceat; only the (inherently sequential) pick runs per bucket.
+    """
+    x, y = _as_arrays(x, y)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # Mean of each bucket, plus the last point standing in for the bucket after the final one
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(x, y, n_out):
+    """Keep the lowest and highest point of each bucket ((n_out - 2) // 2 buckets).
+
+    Buckets are equal spans of x (like pixel columns on a chart), so sparse
+    years get the same resolution as densely logged ones. Guarantees every
+    local peak and trough at bucket resolution survives, which is what matters
+    for spotting yo-yo cycles.
+    """
+    x, y = _as_arrays(x, y)
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    n_buckets = (n_out - 2) // 2
+    span = max(x[-1] - x[0], 1e-12)
+    bucket = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    # Sorting by (bucket, y) puts each bucket's min first and its max last
+    order = np.lexsort((y, bucket))
+    first = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    last = np.r_[first[1:] - 1, n - 1]
+    keep = np.concatenate(([0, n - 1], order[first], order[last]))
+    return np.unique(keep)
+
+
+MODES = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(x, y, n_out, mode='lttb'):
+    """Indices of at most n_out points of (x, y), skipping NaN values in y."""
+    x, y = _as_arrays(x, y)
+    valid = np.flatnonzero(~np.isnan(y))
+    idx = MODES[mode](x[valid], y[valid], n_out)
+    return valid[idx]
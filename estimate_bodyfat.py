@@ -1,90 +1,151 @@
-import pandas as pd
 import numpy as np
 
-def estimate_body_fat():
+from metrics import HEIGHT_CM
+
+# Data points
+SCENARIOS = [
+    {'Era': '2013 (Leanest)', 'Weight': 80.0, 'Waist': 80.0},
+    {'Era': '2025 (Peak)', 'Weight': 115.0, 'Waist': 113.0},
+    {'Era': '2026 (Current)', 'Weight': 104.7, 'Waist': 100.5},
+    {'Era': 'Goal (Primary)', 'Weight': 100.0, 'Waist': 96.0}, # Est waist based on current trend (approx 0.8cm per kg)
+    {'Era': 'Goal (Secondary)', 'Weight': 95.0, 'Waist': 92.0},  # Est waist
+]
+
+
+def neck_estimate(weight):
+    """Neck size (cm) estimated from weight, since we don't log neck measurements.
+
+    Neck usually grows with weight but less than waist:
+    80kg -> 38.2, 105kg -> 41.2, 115kg -> 42.4 (conservative)
     """
-    Estimates Body Fat % using the Navy Seal Formula:
+    return 37 + (np.asarray(weight, dtype=np.float64) - 70) * 0.12
+
+
+def body_fat_grid(weight, waist, necks=None, heights=HEIGHT_CM):
+    """Navy formula BF% and lean mass for every row in one NumPy pass.
+
     BF% = 495 / (1.0324 - 0.19077 * log10(waist - neck) + 0.15456 * log10(height)) - 450
-    
-    Since we don't have neck measurements, we will use a standard estimate based on BMI/Weight
-    or provide a range based on typical neck sizes (38cm - 42cm).
-    
-    We will calculate:
+
+    weight/waist are 1-D arrays (one value per row). necks and heights are
+    ranges broadcast as extra dimensions, so the result has shape
+    (rows, len(necks), len(heights)); necks=None uses the weight-based
+    neck_estimate() per row (a neck axis of length 1). Rows where waist <= neck
+    or either input is missing come out as NaN.
+    """
+    weight = np.asarray(weight, dtype=np.float64)[:, None, None]
+    waist = np.asarray(waist, dtype=np.float64)[:, None, None]
+    neck = neck_estimate(weight) if necks is None else np.atleast_1d(np.asarray(necks, dtype=np.float64))[None, :, None]
+    height = np.atleast_1d(np.asarray(heights, dtype=np.float64))[None, None, :]
+
+    girth = waist - neck
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bf = 495 / (1.0324 - 0.19077 * np.log10(np.where(girth > 0, girth, np.nan))
+                    + 0.15456 * np.log10(height)) - 450
+    lean = weight * (1 - bf / 100)
+    return bf, lean
+
+
+def body_fat_series(dates, weight, waist, necks=None, heights=HEIGHT_CM):
+    """BF% and lean-mass points for every row that has both weight and waist.
+
+    Each point carries the median over the neck x height grid, plus the
+    min/max of BF% across it when a range was given.
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    waist = np.asarray(waist, dtype=np.float64)
+    rows = np.flatnonzero(~np.isnan(weight) & ~np.isnan(waist))
+    if not len(rows):
+        return []
+    bf, lean = body_fat_grid(weight[rows], waist[rows], necks, heights)
+    bf, lean = bf.reshape(len(rows), -1), lean.reshape(len(rows), -1)
+    ok = ~np.isnan(bf).all(axis=1)
+    rows, bf, lean = rows[ok], bf[ok], lean[ok]
+    mid_bf, mid_lean = np.nanmedian(bf, axis=1), np.nanmedian(lean, axis=1)
+    ranged = bf.shape[1] > 1
+    lo_bf, hi_bf = (np.nanmin(bf, axis=1), np.nanmax(bf, axis=1)) if ranged else (None, None)
+
+    points = []
+    for i, row in enumerate(rows):
+        point = {'date': dates[row], 'weight': float(weight[row]), 'waist_cm': float(waist[row]),
+                 'body_fat': round(float(mid_bf[i]), 2), 'lean_mass': round(float(mid_lean[i]), 2)}
+        if ranged:
+            point['body_fat_min'] = round(float(lo_bf[i]), 2)
+            point['body_fat_max'] = round(float(hi_bf[i]), 2)
+        points.append(point)
+    return points
+
+
+def category(bf_percent):
+    if bf_percent < 14: return "Athletic"
+    if bf_percent < 17: return "Fitness"
+    if bf_percent < 25: return "Average"
+    return "Obese" # Navy formula overestimates slightly for muscular people?
+
+
+def estimate_body_fat(timeline=None):
+    """
+    Estimates Body Fat % using the Navy Seal Formula over the scenarios below
+    and over the whole consolidated timeline (every row with weight and waist).
+
+    Since we don't have neck measurements, we use a weight-based neck estimate,
+    and show the spread over typical neck sizes (38cm - 44cm) for the timeline.
+
+    Scenarios:
     1. 2013 (Leannest): Weight 80kg, Waist 80cm
     2. 2025 (Peak): Weight 115kg, Waist ~113cm
     3. 2026 (Current): Weight 104.7kg, Waist 100.5cm
     """
-    
-    HEIGHT_CM = 183
-    
-    # Data points
-    scenarios = [
-        {'Era': '2013 (Leanest)', 'Weight': 80.0, 'Waist': 80.0},
-        {'Era': '2025 (Peak)', 'Weight': 115.0, 'Waist': 113.0},
-        {'Era': '2026 (Current)', 'Weight': 104.7, 'Waist': 100.5},
-        {'Era': 'Goal (Primary)', 'Weight': 100.0, 'Waist': 96.0}, # Est waist based on current trend (approx 0.8cm per kg)
-        {'Era': 'Goal (Secondary)', 'Weight': 95.0, 'Waist': 92.0},  # Est waist
-    ]
-    
-    # Neck size assumptions (cm)
-    # Neck usually grows with weight but less than waist.
-    # At 80kg, neck might be ~38cm. At 115kg, maybe ~43cm.
-    # We'll use a sliding scale estimate: Base 38cm + (Weight - 80) * 0.1 ? 
-    # Let's try 3 neck sizes: Small (38), Med (40), Large (42) to give a range.
-    
-    neck_sizes = [38, 40, 42, 44]
-    
+    weights = np.array([s['Weight'] for s in SCENARIOS])
+    waists = np.array([s['Waist'] for s in SCENARIOS])
+    est_necks = neck_estimate(weights)
+    bf, lean = body_fat_grid(weights, waists)
+    bf, lean = bf[:, 0, 0], lean[:, 0, 0]
+
     print(f"{'Era':<20} | {'Weight':<8} | {'Waist':<8} | {'Neck Est':<10} | {'Est BF%':<10} | {'Category'}")
     print("-" * 80)
-    
-    results = []
-
-    for s in scenarios:
-        # Estimate neck based on weight to narrow it down
-        # Heuristic: Neck = 37 + (Weight - 70) * 0.15 roughly? 
-        # 80kg -> 38.5
-        # 105kg -> 42.25
-        # 115kg -> 43.75
-        est_neck = 37 + (s['Weight'] - 70) * 0.12 # Conservative estimate
-        
-        bf_percent = 495 / (1.0324 - 0.19077 * np.log10(s['Waist'] - est_neck) + 0.15456 * np.log10(HEIGHT_CM)) - 450
-        
-        # Categorize
-        cat = "Obese"
-        if bf_percent < 25: cat = "Average"
-        if bf_percent < 17: cat = "Fitness"
-        if bf_percent < 14: cat = "Athletic"
-        if bf_percent > 25: cat = "Obese" # Navy formula overestimates slightly for muscular people?
-        
-        print(f"{s['Era']:<20} | {s['Weight']:<8} | {s['Waist']:<8} | {est_neck:<10.1f} | {bf_percent:<10.1f}% | {cat}")
-        
-        results.append({
-            'Era': s['Era'],
-            'Weight': s['Weight'],
-            'BF': bf_percent,
-            'MuscleMass': s['Weight'] * (1 - bf_percent/100)
-        })
+    for s, neck, bf_percent in zip(SCENARIOS, est_necks, bf):
+        print(f"{s['Era']:<20} | {s['Weight']:<8} | {s['Waist']:<8} | {neck:<10.1f} | {bf_percent:<10.1f}% | {category(bf_percent)}")
 
     # Lean Mass Comparison
     print("\n--- Lean Mass Analysis (LBM) ---")
-    lbm_2013 = results[0]['MuscleMass']
-    lbm_now = results[2]['MuscleMass']
-    
+    lbm_2013 = lean[0]
+    lbm_now = lean[2]
+
     print(f"2013 Est. Lean Mass: {lbm_2013:.1f} kg")
     print(f"2026 Est. Lean Mass: {lbm_now:.1f} kg")
     print(f"Difference: {lbm_now - lbm_2013:.1f} kg (Matches our prev estimate of 5-8kg!)")
-    
+
     # Target Recommendations
     print("\n--- Target Recommendations ---")
     print("For a 'Fitness' look (15-17% BF):")
-    # If LBM is ~78kg (current est)
     # Weight = LBM / (1 - TargetBF)
-    # Weight = 78 / (1 - 0.15) = 91.7kg
     target_weight_15 = lbm_now / 0.85
     print(f"To reach 15% BF (maintaining current muscle): ~{target_weight_15:.1f} kg")
-    
+
     target_weight_12 = lbm_now / 0.88
     print(f"To reach 12% BF (Athletic/Abs visible): ~{target_weight_12:.1f} kg")
 
+    # Whole timeline, with the neck range as a broadcast dimension. On its own
+    # this reads two columns with the csv module; pandas only comes in with a
+    # shared Timeline (run_reports)
+    if timeline is None:
+        from health_store import load_arrays
+        data = load_arrays(['weight', 'waist_cm'])
+        dates, weight, waist = data['date'].astype(str), data['weight'], data['waist_cm']
+    else:
+        df = timeline.measurements
+        dates, weight, waist = df['date'].dt.strftime('%Y-%m-%d').to_numpy(), df['weight'], df['waist_cm']
+    points = body_fat_series(dates, weight, waist, necks=[38, 40, 42, 44])
+    if points:
+        print(f"\n--- Timeline ({len(points)} measurements, neck 38-44cm) ---")
+        by_year = {}
+        for p in points:
+            by_year.setdefault(p['date'][:4], []).append(p)
+        print(f"{'Year':<6} | {'BF% (range)':<18} | {'Lean Mass':<10}")
+        for year, pts in by_year.items():
+            bf_range = (f"{np.mean([p['body_fat'] for p in pts]):.1f} "
+                        f"({min(p['body_fat_min'] for p in pts):.1f}-{max(p['body_fat_max'] for p in pts):.1f})")
+            print(f"{year:<6} | {bf_range:<18} | {np.mean([p['lean_mass'] for p in pts]):.1f} kg")
+
 if __name__ == "__main__":
     estimate_body_fat()
@@ -0,0 +1,40 @@
+"""Production server config: gunicorn -c gunicorn.conf.py server:app
+
+Several worker processes share DATA_DIR safely: every write takes an
+exclusive flock and appends to the journal, and each worker picks up the
+others' writes before answering (see storage.py). Reads scale with workers;
+writes are serialized, so no PUT is lost.
+
+Tuned through the environment:
+    PORT              listen port (default 5000)
+    WEB_CONCURRENCY   worker processes (default: one per core, at least 2)
+    THREADS           threads per worker for I/O-bound requests (default 4)
+    WORKER_CLASS      gthread (default), or gevent/eventlet if installed
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('THREADS', '4'))
+# Each worker keeps its own in-memory view, so don't preload the app (and its stores)
+preload_app = False
+timeout = 30
+graceful_timeout = 30
+accesslog = '-'
+
+
+def on_starting(arbiter):
+    # Seed once in the master, before any worker can see an empty data dir. Only
+    # storage is imported here: the app itself is imported by each worker
+    import storage
+    storage.seed_if_empty(os.environ.get('DATA_DIR', './data'))
+
+
+def post_worker_init(worker):
+    # Each worker loads its stores and builds its caches before taking requests,
+    # and runs its own profiler thread (threads don't survive the fork)
+    import server
+    server.warm_up()
+    server.start_profiler()
@@ -0,0 +1,374 @@
+"""Shared loader for the consolidated health timeline.
+
+process_health_data.py writes one file per year under consolidated/: CSV and
+JSON always, plus a typed Parquet file when pyarrow is installed. The analysis
+scripts load through load_health_data(), which reads only the years and
+columns they ask for and always returns the same typed schema:
+
+    date        datetime64
+    metrics     float32 on disk (weight, waist_cm, ... fat_g), float64 by default in memory
+    type        categorical
+    notes       string
+    *_source    categorical: which raw export supplied each value (provenance)
+
+Scripts that only need a few metric columns can use load_arrays() instead,
+which returns plain NumPy arrays and never imports pandas. pandas (and
+pyarrow) are imported only by the functions that use them.
+
+Alongside the partitions, consolidated/timeline.bin holds every metric as a
+fixed-width binary snapshot (see TimelineSnapshot) that readers map with
+numpy.memmap instead of parsing: a date range is two binary searches and a
+slice, and worker processes share the pages through the OS cache.
+"""
+import csv
+import importlib.util
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from storage import NEW_FILE_MODE
+
+# Only needed for the Parquet partitions; checked without importing it
+HAS_PARQUET = importlib.util.find_spec('pyarrow') is not None
+
+PARTITION_DIR = 'consolidated'
+# RollingStats state (see rolling_stats.py) kept current by process_health_data.py
+STATS_FILE = os.path.join(PARTITION_DIR, 'stats.json')
+CONSOLIDATED_CSV = 'consolidated_health_data.csv'
+SNAPSHOT_FILE = os.path.join(PARTITION_DIR, 'timeline.bin')
+# Raw export files read by process_health_data.py (the server uploads them under these keys)
+EXPORT_FILES = {
+    'weight': 'historical_weight_2012_2026_raw.txt',
+    'measurements': 'historical_measurements_2012_2026_raw.txt',
+    'daily_log': 'recent_daily_log_2025_2026_raw.txt',
+}
+
+METRIC_COLUMNS = ['weight', 'waist_cm', 'hips_cm', 'biceps_l', 'biceps_r',
+                  'calories', 'protein_g', 'carbs_g', 'fat_g']
+ENTRY_TYPES = ['weight_history', 'measurements', 'daily_log', 'snapshot']
+
+# Column order of the consolidated exports
+COLUMNS = ['date', 'weight', 'notes', 'type', 'waist_cm', 'hips_cm', 'biceps_l', 'biceps_r',
+           'calories', 'protein_g', 'carbs_g', 'fat_g']
+# Columns merged per value, and the provenance column naming the source of each
+VALUE_COLUMNS = [c for c in COLUMNS if c not in ('date', 'type')]
+PROVENANCE_COLUMNS = [f'{c}_source' for c in VALUE_COLUMNS]
+
+
+def partition_path(year, ext, partition_dir=PARTITION_DIR):
+    return os.path.join(partition_dir, f'{year}.{ext}')
+
+
+def partition_years(partition_dir=PARTITION_DIR, ext='csv'):
+    if not os.path.isdir(partition_dir):
+        return []
+    return sorted(int(name.split('.')[0]) for name in os.listdir(partition_dir)
+                  if name.endswith('.' + ext) and name.split('.')[0].isdigit())
+
+
+def _clean_note(val):
+    # Notes that look numeric were parsed as floats (e.g. 2012.0); keep them as text
+    if isinstance(val, float):
+        return None if np.isnan(val) else f'{val:g}'
+    return val
+
+
+def apply_schema(df):
+    """Coerce a consolidated frame to the typed schema (only the columns present)."""
+    import pandas as pd
+    df = df.copy()
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    for col in METRIC_COLUMNS:
+        if col in df.columns:
+            values = df[col]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = values.astype(str).str.replace(',', '')
+            df[col] = pd.to_numeric(values, errors='coerce').astype('float32')
+    for col in ['type'] + PROVENANCE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.Categorical(df[col], categories=ENTRY_TYPES)
+    if 'notes' in df.columns:
+        df['notes'] = df['notes'].map(_clean_note).astype('string')
+    return df
+
+
+def write_parquet_partition(part, year, partition_dir=PARTITION_DIR):
+    """Write one year as a typed Parquet file (no-op without pyarrow)."""
+    if HAS_PARQUET:
+        apply_schema(part).to_parquet(partition_path(year, 'parquet', partition_dir), index=False)
+
+
+def load_health_data(columns=None, start=None, end=None, float_dtype='float64', partition_dir=PARTITION_DIR):
+    """Load the consolidated timeline, typed, sorted by date.
+
+    columns: metric/other columns to read besides `date` (default: all)
+    start/end: inclusive date bounds; only the partitions for those years are read
+    float_dtype: metrics are stored as float32; by default they are widened to
+        float64 for reporting (pass 'float32' to keep the compact form)
+
+    Metric-only reads come from the binary snapshot when it is current;
+    otherwise the Parquet partitions when available, then the CSV partitions,
+    and finally the monolithic consolidated_health_data.csv.
+    """
+    import pandas as pd
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    wanted = ['date'] + [c for c in (columns or COLUMNS) if c != 'date']
+
+    if all(c in METRIC_COLUMNS for c in wanted[1:]):
+        snapshot = open_snapshot(partition_dir)
+        if snapshot is not None:
+            arrays = snapshot.arrays(wanted[1:], start, end)
+            df = pd.DataFrame({'date': arrays.pop('date').astype('datetime64[ns]')})
+            for col, values in arrays.items():
+                values = values.astype(float_dtype)
+                df[col] = values.round(3) if float_dtype != 'float32' else values
+            return df
+
+    ext = 'parquet' if HAS_PARQUET and partition_years(partition_dir, 'parquet') else 'csv'
+    years = [y for y in partition_years(partition_dir, ext)
+             if (start is None or y >= start.year) and (end is None or y <= end.year)]
+    if years:
+        if ext == 'parquet':
+            frames = [pd.read_parquet(partition_path(y, ext, partition_dir), columns=wanted) for y in years]
+        else:
+            frames = [pd.read_csv(partition_path(y, ext, partition_dir), usecols=wanted) for y in years]
+        df = pd.concat(frames, ignore_index=True)
+    elif partition_years(partition_dir, ext) or not os.path.exists(CONSOLIDATED_CSV):
+        df = pd.DataFrame(columns=wanted)
+    else:
+        df = pd.read_csv(CONSOLIDATED_CSV, usecols=wanted)
+
+    df = apply_schema(df)
+    if float_dtype != 'float32':
+        # float32 keeps ~7 significant digits; rounding to 3 decimals restores the
+        # logged values exactly (104.7, not 104.69999694824219)
+        for col in METRIC_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype(float_dtype).round(3)
+    if start is not None:
+        df = df[df['date'] >= start]
+    if end is not None:
+        df = df[df['date'] <= end]
+    return df.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def _number(text):
+    try:
+        return float(text.replace(',', '')) if text else np.nan
+    except ValueError:
+        return np.nan
+
+
+def load_arrays(columns, start=None, end=None, partition_dir=PARTITION_DIR):
+    """Metric columns as NumPy arrays, read with the csv module (no pandas).
+
+    Returns {'date': datetime64[D] array, column: float64 array (NaN = not
+    logged)} sorted by date. Slices the binary snapshot when it is current,
+    else reads the CSV partitions for the years in [start, end], or the
+    monolithic CSV when there are no partitions.
+    """
+    snapshot = open_snapshot(partition_dir)
+    if snapshot is not None:
+        arrays = snapshot.arrays(columns, start, end)
+        for c in columns:
+            # Widened and rounded as in load_health_data, so values match the CSVs
+            arrays[c] = arrays[c].astype(np.float64).round(3)
+        return arrays
+
+    start = str(start)[:10] if start is not None else None
+    end = str(end)[:10] if end is not None else None
+    years = [y for y in partition_years(partition_dir)
+             if (start is None or y >= int(start[:4])) and (end is None or y <= int(end[:4]))]
+    if years:
+        paths = [partition_path(y, 'csv', partition_dir) for y in years]
+    elif not partition_years(partition_dir) and os.path.exists(CONSOLIDATED_CSV):
+        paths = [CONSOLIDATED_CSV]
+    else:
+        paths = []
+
+    dates, values = [], {c: [] for c in columns}
+    for path in paths:
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                day = (row.get('date') or '')[:10]
+                if not day or (start and day < start) or (end and day > end):
+                    continue
+                dates.append(day)
+                for c in columns:
+                    values[c].append(_number(row.get(c)))
+    days = np.array(dates, dtype='datetime64[D]')
+    order = np.argsort(days, kind='stable')
+    arrays = {'date': days[order]}
+    for c in columns:
+        arrays[c] = np.array(values[c], dtype=np.float64)[order]
+    return arrays
+
+
+# ─── Binary snapshot ─────────────────────────────────────────
+# timeline.bin, little-endian:
+#
+#     b'HOSTL001'                 magic + format version
+#     uint32                      header length
+#     header                      JSON: rows, columns and the byte offset of each array
+#     day[rows]       int32       days since 1970-01-01, ascending (one row per date)
+#     <metric>[rows]  float32     one array per metric, NaN where not logged
+#     valid[metrics, ceil(rows / 8)]  uint8, np.packbits of "has a value", one row per metric
+#
+# Arrays start on 64-byte boundaries so the mapped views are aligned.
+
+SNAPSHOT_MAGIC = b'HOSTL001'
+SNAPSHOT_ALIGN = 64
+
+
+def _align(offset):
+    return -(-offset // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+
+def write_snapshot(days, metrics, path=SNAPSHOT_FILE):
+    """Write the binary snapshot atomically.
+
+    days: ascending datetime64[D] (or anything NumPy converts to it), one per row
+    metrics: {column: values} for METRIC_COLUMNS (missing columns are all NaN)
+    """
+    days = np.asarray(days, dtype='datetime64[D]').astype(np.int64).astype('<i4')
+    rows = len(days)
+    arrays = [('date', days)]
+    arrays += [(c, np.asarray(metrics[c], dtype='<f4') if c in metrics else np.full(rows, np.nan, '<f4'))
+               for c in METRIC_COLUMNS]
+    valid = np.packbits(~np.isnan(np.stack([a for _, a in arrays[1:]]).reshape(len(METRIC_COLUMNS), rows)),
+                        axis=1)
+    arrays.append(('valid', valid))
+
+    offsets, offset = {}, 0
+    header = b''
+    # The header's length depends on the offsets and vice versa; two passes settle it
+    for _ in range(2):
+        offset = _align(len(SNAPSHOT_MAGIC) + 4 + len(header))
+        for name, array in arrays:
+            offsets[name] = offset
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({'rows': rows, 'columns': METRIC_COLUMNS, 'offsets': offsets}).encode()
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + struct.pack('<I', len(header)) + header)
+            for name, array in arrays:
+                f.write(b'\0' * (offsets[name] - f.tell()))
+                f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, NEW_FILE_MODE)  # mkstemp creates 0600
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_frame_snapshot(df, path=SNAPSHOT_FILE, years=None):
+    """Snapshot a consolidated frame (one row per date).
+
+    With `years`, only those years are taken from `df` and every other year is
+    kept from the existing snapshot, so an incremental run doesn't re-read the
+    partitions it didn't touch.
+    """
+    df = apply_schema(df[['date'] + [c for c in METRIC_COLUMNS if c in df.columns]])
+    days = df['date'].to_numpy().astype('datetime64[D]')
+    metrics = {c: df[c].to_numpy() for c in METRIC_COLUMNS if c in df.columns}
+    if years is not None and os.path.exists(path):
+        old = TimelineSnapshot(path)
+        year_of = lambda d: d.astype('datetime64[Y]').astype(int) + 1970
+        keep = ~np.isin(year_of(old.days), list(years))
+        new = np.isin(year_of(days), list(years))
+        days = np.concatenate([old.days[keep], days[new]])
+        metrics = {c: np.concatenate([old.column(c)[keep],
+                                      metrics[c][new] if c in metrics else np.full(new.sum(), np.nan, np.float32)])
+                   for c in METRIC_COLUMNS}
+        order = np.argsort(days, kind='stable')
+        days = days[order]
+        metrics = {c: v[order] for c, v in metrics.items()}
+    write_snapshot(days, metrics, path)
+
+
+class TimelineSnapshot:
+    """Read-only view of timeline.bin; arrays are numpy.memmap views, nothing is parsed.
+
+        snapshot = TimelineSnapshot()
+        weights = snapshot.column('weight')                  # float32, NaN = not logged
+        window = snapshot.arrays(['weight', 'waist_cm'], '2025-01-01', '2025-12-31')
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE):
+        self.path = path
+        # Map the file once: a writer's os.replace then leaves this reader on
+        # the old inode, so the header and every array come from one version
+        self._buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        start = len(SNAPSHOT_MAGIC) + 4
+        if bytes(self._buffer[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError(f'{path} is not a timeline snapshot')
+        (length,) = struct.unpack('<I', bytes(self._buffer[len(SNAPSHOT_MAGIC):start]))
+        header = json.loads(bytes(self._buffer[start:start + length]))
+        self.rows = header['rows']
+        self.columns = header['columns']
+        self._offsets = header['offsets']
+        self._day = self._map('date', '<i4', (self.rows,))
+        self._valid = self._map('valid', np.uint8, (len(self.columns), -(-self.rows // 8)))
+
+    def _map(self, name, dtype, shape):
+        if not self.rows:
+            return np.zeros(shape, dtype=dtype)
+        offset = self._offsets[name]
+        return self._buffer[offset:offset + np.dtype(dtype).itemsize * int(np.prod(shape))].view(dtype).reshape(shape)
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def days(self):
+        """Dates as datetime64[D]."""
+        return self._day.astype('datetime64[D]')
+
+    def column(self, name):
+        if name not in self.columns:
+            raise KeyError(name)
+        return self._map(name, '<f4', (self.rows,))
+
+    def valid(self, name):
+        """Boolean mask of the rows where `name` has a value, from the bitmap."""
+        return np.unpackbits(self._valid[self.columns.index(name)], count=self.rows).astype(bool)
+
+    def bounds(self, start=None, end=None):
+        """Row slice for dates in [start, end] (inclusive, either optional)."""
+        day = lambda d: np.datetime64(str(d)[:10], 'D').astype(np.int64)
+        lo = int(np.searchsorted(self._day, day(start), 'left')) if start is not None else 0
+        hi = int(np.searchsorted(self._day, day(end), 'right')) if end is not None else self.rows
+        return slice(lo, hi)
+
+    def arrays(self, columns, start=None, end=None):
+        """{'date': datetime64[D], column: float32 view} for a date range."""
+        rows = self.bounds(start, end)
+        arrays = {'date': self._day[rows].astype('datetime64[D]')}
+        for c in columns:
+            arrays[c] = self.column(c)[rows]
+        return arrays
+
+
+def open_snapshot(partition_dir=PARTITION_DIR):
+    """The partition store's TimelineSnapshot if it is at least as new as every partition, else None."""
+    path = os.path.join(partition_dir, os.path.basename(SNAPSHOT_FILE))
+    try:
+        written = os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    for name in os.listdir(partition_dir):
+        if name.split('.')[0].isdigit() and os.stat(os.path.join(partition_dir, name)).st_mtime_ns > written:
+            return None
+    return TimelineSnapshot(path)
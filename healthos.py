@@ -0,0 +1,83 @@
+"""healthos: one entry point for the pipeline, the reports and the server.
+
+    python healthos.py process [--incremental]        consolidate the raw exports
+    python healthos.py analyze [REPORT ...] [--parallel]
+    python healthos.py estimate                       body-fat estimate (NumPy only)
+    python healthos.py serve [--port N] [--production]
+
+Each subcommand imports only what it runs, so pandas is loaded by process and
+analyze alone and `healthos --help` or `healthos estimate` start in a
+fraction of the time.
+"""
+import argparse
+import os
+import shutil
+import sys
+
+# Report names for analyze, kept here so --help needs no imports (see run_reports.REPORTS)
+REPORT_NAMES = ('general', 'macros', 'composition', 'bodyfat')
+
+
+def process(args):
+    import process_health_data
+    process_health_data.main(incremental=args.incremental)
+
+
+def analyze(args):
+    import run_reports
+    run_reports.run_reports(args.reports, args.parallel)
+
+
+def estimate(args):
+    import estimate_bodyfat
+    estimate_bodyfat.estimate_body_fat()
+
+
+def serve(args):
+    if not args.production:
+        import server
+        server.serve(args.port)
+        return
+    gunicorn = shutil.which('gunicorn')
+    if gunicorn is None:
+        sys.exit("gunicorn is not installed (pip install -r requirements.txt)")
+    if args.port:
+        os.environ['PORT'] = str(args.port)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.execv(gunicorn, [gunicorn, '-c', 'gunicorn.conf.py', 'server:app'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='healthos', description="HealthOS pipeline, reports and server.")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+
+    command = commands.add_parser('process', help="consolidate the raw exports into consolidated/")
+    command.add_argument('--incremental', action='store_true',
+                         help="only parse rows appended since the last run and rewrite the affected years")
+    command.set_defaults(run=process)
+
+    command = commands.add_parser('analyze', help="run the analysis reports over one load of the data")
+    command.add_argument('reports', nargs='*', metavar='REPORT',
+                         help=f"reports to run: {', '.join(REPORT_NAMES)} (default: all)")
+    command.add_argument('--parallel', action='store_true', help="run the reports in parallel worker processes")
+    command.set_defaults(run=analyze)
+
+    command = commands.add_parser('estimate', help="Navy body-fat estimate over the scenarios and the timeline")
+    command.set_defaults(run=estimate)
+
+    command = commands.add_parser('serve', help="run the API server (development server by default)")
+    command.add_argument('--port', type=int, help="listen port (default: $PORT or 5000)")
+    command.add_argument('--production', action='store_true',
+                         help="run under gunicorn with gunicorn.conf.py instead of the development server")
+    command.set_defaults(run=serve)
+
+    args = parser.parse_args(argv)
+    if args.command == 'analyze':
+        unknown = [name for name in args.reports if name not in REPORT_NAMES]
+        if unknown:
+            parser.error(f"unknown report(s): {', '.join(unknown)} (choose from {', '.join(REPORT_NAMES)})")
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
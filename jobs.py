@@ -0,0 +1,210 @@
+"""Background ingestion jobs for the API server.
+
+Raw exports uploaded to the server are saved into the partition's pipeline
+directory, and a job re-runs the pipeline there on a process pool, so request
+threads never wait on pandas:
+
+    <partition>/pipeline/<export file>      raw exports (names as process_health_data expects)
+    <partition>/pipeline/consolidated/      the year partitions, updated incrementally
+    <partition>/pipeline/reports.json       every report's output, replaced whole per job
+    <partition>/jobs/<id>.json              job status
+    <partition>/jobs/queued.json            the job waiting to start, reused by later submits
+
+Job status lives in files rather than in memory, so with several gunicorn
+workers any of them can answer a poll. Jobs for the same partition take a
+file lock and run one at a time; reports.json is written to a temp file and
+renamed, so readers see the previous run's reports or the new ones, never a
+mix.
+"""
+import io
+import os
+import re
+import tempfile
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
+from datetime import datetime
+from multiprocessing import get_context
+
+from health_store import EXPORT_FILES
+from storage import NEW_FILE_MODE, file_lock, read_data, write_data
+
+# Largest export accepted in one upload
+MAX_EXPORT_BYTES = int(os.environ.get('MAX_EXPORT_BYTES', str(64 * 1024 * 1024)))
+# Pipeline processes per server process
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '1'))
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+# Pipeline output kept in the job status
+LOG_TAIL = 40
+
+
+def now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def pipeline_dir(partition):
+    return os.path.join(partition, 'pipeline')
+
+
+def job_file(partition, job_id):
+    return os.path.join(partition, 'jobs', f'{job_id}.json')
+
+
+def has_exports(partition):
+    """True once any raw export has been uploaded to the partition."""
+    directory = pipeline_dir(partition)
+    return any(os.path.exists(os.path.join(directory, name)) for name in EXPORT_FILES.values())
+
+
+def update_job(path, **fields):
+    job = read_data(path) or {}
+    job.update(fields)
+    write_data(path, job)
+    return job
+
+
+class EmptyExport(ValueError):
+    """An upload with no body, which must not replace the export already stored."""
+
+
+def save_export(partition, name, stream, chunk_size=1 << 20):
+    """Store an uploaded export (a file-like stream) atomically; returns its size in bytes.
+
+    Raises ValueError when it is larger than MAX_EXPORT_BYTES, and EmptyExport
+    when it is empty, leaving the previous upload in place.
+    """
+    directory = pipeline_dir(partition)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, EXPORT_FILES[name])
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=EXPORT_FILES[name] + '.', suffix='.tmp')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while chunk := stream.read(chunk_size):
+                size += len(chunk)
+                if size > MAX_EXPORT_BYTES:
+                    raise ValueError(f'export larger than {MAX_EXPORT_BYTES} bytes')
+                f.write(chunk)
+            if not size:
+                raise EmptyExport('Expected the export as the request body')
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, NEW_FILE_MODE)  # mkstemp creates 0600
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return size
+
+
+# ─── In the worker process ───────────────────────────────────
+
+def run_pipeline(partition, job_id):
+    """Consolidate the partition's exports and republish its reports (runs in a pool process)."""
+    partition = os.path.abspath(partition)
+    status = job_file(partition, job_id)
+    directory = pipeline_dir(partition)
+    os.makedirs(directory, exist_ok=True)
+    with file_lock(os.path.join(directory, 'pipeline.lock')):
+        update_job(status, status='running', started=now())
+        cwd = os.getcwd()
+        log = io.StringIO()
+        try:
+            # The pipeline and reports work on paths relative to the current directory
+            os.chdir(directory)
+            import process_health_data
+            from metrics import Timeline
+            from run_reports import REPORTS
+
+            with redirect_stdout(log):
+                process_health_data.main(incremental=True)
+            timeline = Timeline()
+            reports = {}
+            for name, (title, report) in REPORTS.items():
+                out = io.StringIO()
+                try:
+                    with redirect_stdout(out):
+                        report(timeline)
+                    reports[name] = {'title': title, 'output': out.getvalue()}
+                except Exception as e:  # e.g. no macro logs uploaded yet: keep the other reports
+                    reports[name] = {'title': title, 'output': out.getvalue(), 'error': repr(e)}
+            write_data('reports.json', {'job': job_id, 'created': now(), 'reports': reports})
+        except Exception:
+            update_job(status, status='failed', finished=now(), log=log.getvalue().splitlines()[-LOG_TAIL:],
+                       error=traceback.format_exc().strip().splitlines()[-1])
+            return
+        finally:
+            os.chdir(cwd)
+        update_job(status, status='done', finished=now(), log=log.getvalue().splitlines()[-LOG_TAIL:],
+                   reports=list(reports))
+
+
+# ─── In the server ───────────────────────────────────────────
+
+class JobQueue:
+    """Submits pipeline jobs to a process pool, started on first use.
+
+    The pool spawns fresh interpreters rather than forking the (threaded)
+    server process.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, partition, trigger):
+        """Queue a pipeline run for a partition; returns the job's status.
+
+        If a run is already queued (e.g. the other exports of a batch upload),
+        that job is returned instead: it hasn't read the exports yet, so it
+        picks this change up too.
+        """
+        directory = os.path.join(partition, 'jobs')
+        os.makedirs(directory, exist_ok=True)
+        with file_lock(os.path.join(directory, 'submit.lock')):
+            queued = self.status(partition, (read_data(os.path.join(directory, 'queued.json')) or {}).get('id', ''))
+            if queued is not None and queued.get('status') == 'queued':
+                return queued
+            job_id = uuid.uuid4().hex
+            path = job_file(partition, job_id)
+            job = update_job(path, id=job_id, status='queued', trigger=trigger, created=now())
+            write_data(os.path.join(directory, 'queued.json'), {'id': job_id})
+        try:
+            future = self._submit(run_pipeline, partition, job_id)
+        except Exception as e:
+            return update_job(path, status='failed', finished=now(), error=repr(e))
+        future.add_done_callback(lambda f: self._crashed(f, path))
+        return job
+
+    def _submit(self, fn, *args):
+        # A worker that dies (e.g. killed for memory) breaks the whole pool for
+        # good, so start a fresh one and retry once
+        with self._lock:
+            for retry in (False, True):
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context('spawn'))
+                try:
+                    return self._pool.submit(fn, *args)
+                except BrokenProcessPool:
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+                    if retry:
+                        raise
+
+    @staticmethod
+    def _crashed(future, path):
+        # The worker died before it could record the outcome itself
+        if future.exception() is not None and read_data(path).get('status') not in ('done', 'failed'):
+            update_job(path, status='failed', finished=now(), error=repr(future.exception()))
+
+    @staticmethod
+    def status(partition, job_id):
+        """A job's status, or None if there is no such job in this partition."""
+        if not JOB_ID_RE.match(job_id):
+            return None
+        return read_data(job_file(partition, job_id)) or None
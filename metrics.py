@@ -0,0 +1,80 @@
+"""Shared metrics layer for the analysis reports.
+
+A Timeline wraps one load of the consolidated data and computes derived
+columns (BMI, WHR, year, weekly macro resample, ...) on first use, memoizing
+them, so several reports run in one process share a single load and pass:
+
+    timeline = Timeline()
+    analyze_health_data(timeline)
+    analyze_macros(timeline)
+
+User constants and targets live here instead of in each script. pandas is
+only imported when a Timeline is built, so the server can share the constants.
+"""
+from functools import cached_property
+
+# User constants
+HEIGHT_CM = 183
+HEIGHT_M = HEIGHT_CM / 100
+AGE = 44
+GENDER = 'M'
+
+# Daily targets
+TARGET_CALORIES = 2400
+TARGET_PROTEIN = 180
+
+# Every column the reports read
+REPORT_COLUMNS = ['weight', 'waist_cm', 'hips_cm', 'calories', 'protein_g']
+
+
+class Timeline:
+    """The consolidated timeline plus lazily computed, memoized derived columns.
+
+    columns: what to load (default: everything the reports need). A report
+    run on its own asks only for its columns; the combined runner loads
+    REPORT_COLUMNS once.
+    """
+
+    def __init__(self, columns=None, df=None):
+        if df is None:
+            from health_store import load_health_data
+            df = load_health_data(columns=columns or REPORT_COLUMNS)
+        self.df = df
+
+    @cached_property
+    def year(self):
+        return self.df['date'].dt.year
+
+    @cached_property
+    def bmi(self):
+        return self.df['weight'] / (HEIGHT_M ** 2)
+
+    @cached_property
+    def whr(self):
+        return self.df['waist_cm'] / self.df['hips_cm']
+
+    @cached_property
+    def weights(self):
+        """Rows with a weight."""
+        return self.df.dropna(subset=['weight'])
+
+    @cached_property
+    def measurements(self):
+        """Rows with both weight and waist."""
+        return self.df.dropna(subset=['weight', 'waist_cm'])
+
+    @cached_property
+    def macros(self):
+        """Rows with logged calories (the macro-tracking era)."""
+        return self.df.dropna(subset=['calories'])
+
+    @cached_property
+    def weekly_macros(self):
+        """Weekly mean calories/protein, end-of-week weight and its weekly change."""
+        weekly = self.macros.set_index('date').resample('W').agg({
+            'calories': 'mean',
+            'protein_g': 'mean',
+            'weight': 'last',  # Weight at end of week
+        })
+        weekly['weight_change'] = weekly['weight'].diff()
+        return weekly
@@ -1,60 +1,143 @@
 import pandas as pd
+import numpy as np
+import argparse
 import glob
+import hashlib
+import io
+import json
 import os
 import re
+from itertools import chain
 
-def parse_weight_file(filepath):
-    """Parses the weight history file."""
+import rolling_stats
+from health_store import (COLUMNS, ENTRY_TYPES, EXPORT_FILES, PARTITION_DIR, PROVENANCE_COLUMNS, SNAPSHOT_FILE,
+                          STATS_FILE, VALUE_COLUMNS, partition_path, partition_years, write_frame_snapshot,
+                          write_parquet_partition)
+
+# Raw exports: name -> (file, chunk iterator, header lines before the first data row).
+# Prefer the comprehensive logs over the manual snapshot (parse_snapshot_file).
+SOURCES = {
+    'weight': (EXPORT_FILES['weight'], 'iter_weight_chunks', 1),
+    'measurements': (EXPORT_FILES['measurements'], 'iter_measurement_chunks', 3),
+    'daily_log': (EXPORT_FILES['daily_log'], 'iter_daily_log_chunks', 1),
+}
+
+# When several sources have a value for the same date and column, the highest
+# priority wins. daily_log is the most recent and detailed (macros, hips).
+SOURCE_PRIORITY = {'snapshot': 0, 'weight_history': 1, 'measurements': 2, 'daily_log': 3}
+
+# Year-partitioned consolidated store; the monolithic exports are stitched from it
+STATE_FILE = os.path.join(PARTITION_DIR, 'state.json')
+
+# ─── Streaming parsers ───────────────────────────────────────
+# Raw exports are read CHUNK_ROWS rows at a time and each chunk is normalised
+# on its own, so peak memory is bounded by the chunk size rather than the file.
+
+# Rows per chunk when streaming raw exports
+CHUNK_ROWS = 50_000
+# Source rows buffered by consolidate() before they are folded into the result
+COMPACT_ROWS = 20 * CHUNK_ROWS
+
+# Numeric columns across all exports (after renaming)
+NUMERIC_COLUMNS = ['weight', 'waist_cm', 'hips_cm', 'biceps_l', 'biceps_r',
+                   'calories', 'protein_g', 'carbs_g', 'fat_g']
+
+
+def read_tsv_chunks(filepath, rename, columns, source_type, skiprows=0):
+    """Yield normalised chunks of a raw TSV export.
+
+    Dates and notes are read as text; numbers are parsed by the C reader with
+    thousands=',' so '2,419' needs no string cleanup. Anything still non-numeric
+    in a chunk (e.g. '~100') is coerced to NaN.
+    """
+    reader = pd.read_csv(filepath, sep='\t', skiprows=skiprows, chunksize=CHUNK_ROWS,
+                         thousands=',', dtype={'Date': str, 'Notes': str})
+    for chunk in reader:
+        chunk = chunk.rename(columns=rename)
+        # Convert date, and filter out rows with no date
+        chunk['date'] = pd.to_datetime(chunk['date'], format='%d/%m/%Y', errors='coerce')
+        chunk = chunk.dropna(subset=['date'])
+        # Only keep columns that exist (in case of naming issues)
+        chunk = chunk[[c for c in columns if c in chunk.columns]].copy()
+        for col in NUMERIC_COLUMNS:
+            if col in chunk.columns:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+        chunk['type'] = source_type
+        yield chunk
+
+
+def collect(chunks):
+    """Materialise a chunk stream as one DataFrame."""
+    chunks = list(chunks)
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def iter_weight_chunks(filepath):
+    """Streams the weight history file."""
     try:
         # Header is on the first line
-        df = pd.read_csv(filepath, sep='\t')
-        # Rename columns to be consistent
-        df = df.rename(columns={'Date': 'date', 'Weight (kg)': 'weight', 'Notes': 'notes'})
-        # Convert date
-        df['date'] = pd.to_datetime(df['date'], format='%d/%m/%Y', errors='coerce')
-        # Filter out rows with no date
-        df = df.dropna(subset=['date'])
-        # Select relevant columns
-        df = df[['date', 'weight', 'notes']]
-        df['type'] = 'weight_history'
-        return df
+        yield from read_tsv_chunks(
+            filepath,
+            rename={'Date': 'date', 'Weight (kg)': 'weight', 'Notes': 'notes'},
+            columns=['date', 'weight', 'notes'],
+            source_type='weight_history')
     except Exception as e:
         print(f"Error parsing weight file: {e}")
-        return pd.DataFrame()
 
-def parse_measurements_file(filepath):
-    """Parses the measurements file."""
+
+def iter_measurement_chunks(filepath):
+    """Streams the measurements file."""
     try:
         # Header is on the 3rd line (skip 2 lines: Title, Empty)
-        df = pd.read_csv(filepath, sep='\t', skiprows=2)
-        
-        # Rename columns
-        df = df.rename(columns={
-            'Date': 'date', 
-            'Waist (cm)': 'waist_cm', 
-            'Hips (cm)': 'hips_cm',
-            'Biceps (L)': 'biceps_l',
-            'Biceps (R)': 'biceps_r',
-            'Notes': 'notes'
-        })
-        
-        # Convert date
-        df['date'] = pd.to_datetime(df['date'], format='%d/%m/%Y', errors='coerce')
-        
-        # Filter out rows with no date
-        df = df.dropna(subset=['date'])
-        
-        # Select relevant
-        cols = ['date', 'waist_cm', 'hips_cm', 'biceps_l', 'biceps_r', 'notes']
-        # Only keep columns that exist (in case of naming issues)
-        existing_cols = [c for c in cols if c in df.columns]
-        df = df[existing_cols]
-        df['type'] = 'measurements'
-        
-        return df
+        yield from read_tsv_chunks(
+            filepath,
+            rename={
+                'Date': 'date',
+                'Waist (cm)': 'waist_cm',
+                'Hips (cm)': 'hips_cm',
+                'Biceps (L)': 'biceps_l',
+                'Biceps (R)': 'biceps_r',
+                'Notes': 'notes'
+            },
+            columns=['date', 'waist_cm', 'hips_cm', 'biceps_l', 'biceps_r', 'notes'],
+            source_type='measurements',
+            skiprows=2)
     except Exception as e:
         print(f"Error parsing measurements file: {e}")
-        return pd.DataFrame()
+
+
+def iter_daily_log_chunks(filepath):
+    """Streams the detailed daily logs (Nov 2025 - Feb 2026)."""
+    try:
+        # Header is on the first line
+        # Date	Calories	Protein (g)	Carbs (g)	Fat (g)	Weight (kg)	Waist (cm)	Hips (cm)
+        yield from read_tsv_chunks(
+            filepath,
+            rename={
+                'Date': 'date',
+                'Calories': 'calories',
+                'Protein (g)': 'protein_g',
+                'Carbs (g)': 'carbs_g',
+                'Fat (g)': 'fat_g',
+                'Weight (kg)': 'weight',
+                'Waist (cm)': 'waist_cm',
+                'Hips (cm)': 'hips_cm'
+            },
+            columns=['date', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'weight', 'waist_cm', 'hips_cm'],
+            source_type='daily_log')
+    except Exception as e:
+        print(f"Error parsing daily logs file: {e}")
+
+
+def parse_weight_file(filepath):
+    """Parses the weight history file."""
+    return collect(iter_weight_chunks(filepath))
+
+
+def parse_measurements_file(filepath):
+    """Parses the measurements file."""
+    return collect(iter_measurement_chunks(filepath))
+
 
 def parse_snapshot_file(filepath):
     """Parses the recent snapshot markdown file (heuristic parsing)."""
@@ -113,73 +196,347 @@ def parse_snapshot_file(filepath):
 
 def parse_daily_logs(filepath):
     """Parses the detailed daily logs (Nov 2025 - Feb 2026)."""
-    try:
-        # Header is on the first line
-        df = pd.read_csv(filepath, sep='\t')
-        
-        # Rename columns to be consistent
-        # Date	Calories	Protein (g)	Carbs (g)	Fat (g)	Weight (kg)	Waist (cm)	Hips (cm)
-        rename_map = {
-            'Date': 'date', 
-            'Calories': 'calories',
-            'Protein (g)': 'protein_g',
-            'Carbs (g)': 'carbs_g',
-            'Fat (g)': 'fat_g',
-            'Weight (kg)': 'weight', 
-            'Waist (cm)': 'waist_cm',
-            'Hips (cm)': 'hips_cm'
-        }
-        df = df.rename(columns=rename_map)
-        
-        # Convert date
-        df['date'] = pd.to_datetime(df['date'], format='%d/%m/%Y', errors='coerce')
-        
-        # Filter out rows with no date
-        df = df.dropna(subset=['date'])
-        
-        # Clean numeric columns (remove commas, handle non-numeric)
-        numeric_cols = ['calories', 'protein_g', 'carbs_g', 'fat_g', 'weight', 'waist_cm', 'hips_cm']
-        for col in numeric_cols:
-            if col in df.columns:
-                if df[col].dtype == 'object':
-                     df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-        
-        df['type'] = 'daily_log'
-        return df
-    except Exception as e:
-        print(f"Error parsing daily logs file: {e}")
+    return collect(iter_daily_log_chunks(filepath))
+
+# ─── Merge engine ────────────────────────────────────────────
+
+def merge_sources(frames):
+    """Deterministic priority merge of source rows into one row per date.
+
+    Every input row comes from a single source (its `type`). Rows are ordered
+    with one stable lexsort on (date, source priority), which keeps arrival
+    order within a source; then, per column, the last non-null row of each
+    date group (the highest-priority value) is found with a single
+    maximum.reduceat over row positions. Everything runs on the frames' NumPy
+    arrays: no concatenated DataFrame is built, reordered or grouped. For each
+    value column a `<col>_source` column records which source supplied it;
+    `type` and the provenance columns are categoricals over ENTRY_TYPES, as in
+    the typed schema (see health_store.apply_schema).
+    """
+    frames = [f for f in frames if len(f)]
+
+    def column(name):
+        dtypes = {f[name].dtype for f in frames if name in f.columns}
+        if len(dtypes) == 1 and all(name in f.columns for f in frames) and not isinstance(*dtypes, np.dtype):
+            # e.g. str columns stay pandas arrays, so they are never converted to Python objects
+            return pd.concat([f[name] for f in frames], ignore_index=True).array
+        parts = [f[name].to_numpy() if name in f.columns else np.full(len(f), np.nan) for f in frames]
+        values = np.concatenate(parts) if parts else np.array([], dtype=np.float64)
+        # Missing values become NaN, which integer columns can't hold
+        return values.astype(np.float64) if values.dtype.kind in 'iub' else values
+
+    def priorities(f):
+        types = f['type'] if 'type' in f.columns else pd.Series(np.nan, index=f.index)
+        if (types == types.iloc[0]).all():  # the usual case: one source per frame
+            return np.full(len(f), SOURCE_PRIORITY.get(types.iloc[0], -1))
+        return types.map(SOURCE_PRIORITY).fillna(-1).to_numpy().astype(np.int64)
+
+    priority = np.concatenate([priorities(f) for f in frames]) if frames else np.array([], dtype=np.int64)
+    # Each row's source as a code into ENTRY_TYPES (-1 when it has none)
+    by_priority = np.array([ENTRY_TYPES.index(name) for name in sorted(SOURCE_PRIORITY, key=SOURCE_PRIORITY.get)])
+    sources = np.where(priority >= 0, by_priority[np.maximum(priority, 0)], -1)
+    dates = column('date')
+    order = np.lexsort((priority, dates))
+    dates = dates[order]
+
+    # First row of each date group; positions of non-null values reduced per group
+    # give the last (highest-priority) non-null row, or -1 when the group has none
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]]) if len(dates) else np.array([], dtype=np.int64)
+    positions = np.arange(len(dates))
+
+    def winners(valid):
+        if not len(starts):
+            return starts, starts.astype(bool)
+        last = np.maximum.reduceat(np.where(valid[order], positions, -1), starts)
+        return order[np.maximum(last, 0)], last >= 0
+
+    def take(values, idx, found):
+        if not isinstance(values, np.ndarray):
+            return values.take(np.where(found, idx, -1), allow_fill=True)
+        taken = values[idx]
+        taken[~found] = np.nan
+        return taken
+
+    def source(idx, found):
+        return pd.Categorical.from_codes(np.where(found, sources[idx], -1), categories=ENTRY_TYPES)
+
+    merged = {'date': dates[starts], 'type': source(*winners(sources >= 0))}
+    provenance = {}
+    for c in VALUE_COLUMNS:
+        values = column(c)
+        idx, found = winners(pd.notna(values))
+        merged[c] = take(values, idx, found)
+        provenance[f'{c}_source'] = source(idx, found)
+    return pd.DataFrame({**merged, **provenance})[COLUMNS + PROVENANCE_COLUMNS]
+
+
+def split_by_source(merged):
+    """Turn merged rows back into one row per (date, source), using provenance.
+
+    Lets a previous result be merged again with new rows while every value
+    keeps the priority of the source that supplied it. Rows written before
+    provenance was recorded are attributed to their `type`.
+    """
+    parts = []
+    for source in SOURCE_PRIORITY:
+        owned = {c: merged[f'{c}_source'].eq(source) if f'{c}_source' in merged
+                 else merged['type'].eq(source) & merged[c].notna() for c in VALUE_COLUMNS}
+        # The row that set `type` is kept even if it has no values, so `type` survives a re-merge
+        rows = np.logical_or.reduce([merged['type'].eq(source).to_numpy()] + [m.to_numpy() for m in owned.values()])
+        if not rows.any():
+            continue
+        part = merged.loc[rows, ['date'] + VALUE_COLUMNS].copy()
+        for c in VALUE_COLUMNS:
+            part[c] = part[c].where(owned[c][rows])
+        part['type'] = source
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+
+
+def consolidate(frames):
+    """Merge parsed frames (or a stream of chunks) into one row per date.
+
+    Chunks are buffered and merged in one pass at the end. Once the buffer
+    outgrows both COMPACT_ROWS and the merged result so far, it is folded into
+    that result, so memory stays bounded by the number of distinct dates plus
+    the buffer while every row is merged a constant number of times on
+    average. Frames that are themselves merge results (they carry provenance
+    columns) are split back into source rows first.
+    """
+    consolidated, pending, pending_rows = None, [], 0
+    for chunk in frames:
+        if chunk.empty:
+            continue
+        if PROVENANCE_COLUMNS[0] in chunk.columns:
+            chunk = split_by_source(chunk)
+        pending.append(chunk)
+        pending_rows += len(chunk)
+        if pending_rows > max(COMPACT_ROWS, 0 if consolidated is None else len(consolidated)):
+            consolidated = merge_sources(pending if consolidated is None else [split_by_source(consolidated)] + pending)
+            pending, pending_rows = [], 0
+    if pending:
+        consolidated = merge_sources(pending if consolidated is None else [split_by_source(consolidated)] + pending)
+    if consolidated is None:
+        return pd.DataFrame(columns=COLUMNS + PROVENANCE_COLUMNS).astype({'date': 'datetime64[ns]'})
+    return consolidated
+
+
+# ─── Incremental state ───────────────────────────────────────
+# For each raw export we remember its size, content hash and how many data
+# rows we have consumed. If a file has only grown (the old bytes hash the same),
+# just the appended rows are parsed; any other edit triggers a full rebuild.
+
+def file_digest(path, size=None):
+    """sha256 of the first `size` bytes of a file (the whole file by default)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = size if size is not None else float('inf')
+        while remaining > 0:
+            chunk = f.read(int(min(1 << 20, remaining)))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+
+def source_state(path, rows):
+    return {'size': os.path.getsize(path), 'sha256': file_digest(path), 'rows': rows}
+
+
+def count_rows(path, header_lines):
+    with open(path, 'rb') as f:
+        return max(0, sum(1 for line in f if line.strip()) - header_lines)
+
+
+def read_appended(path, iter_chunks, header_lines, old):
+    """Parse only the rows appended since `old` was recorded.
+
+    Returns the new rows, or None when the file changed in any other way and
+    needs a full rebuild.
+    """
+    if not old['size'] or os.path.getsize(path) < old['size'] \
+            or file_digest(path, old['size']) != old['sha256']:
+        return None
+    with open(path, 'rb') as f:
+        header = b''.join(f.readline() for _ in range(header_lines))
+        f.seek(old['size'] - 1)
+        if f.read(1) != b'\n':
+            return None  # the last old row was extended in place
+        tail = f.read()
+    if not tail.strip():
         return pd.DataFrame()
+    return collect(iter_chunks(io.StringIO((header + tail).decode('utf-8'))))
 
-def main():
-    # 1. Loading data
-    weight_df = parse_weight_file('historical_weight_2012_2026_raw.txt')
-    measurements_df = parse_measurements_file('historical_measurements_2012_2026_raw.txt')
-    # Prefer the comprehensive logs over the manual snapshot
-    # snapshot_df = parse_snapshot_file('health_tracker_snapshot.md') 
-    daily_logs_df = parse_daily_logs('recent_daily_log_2025_2026_raw.txt')
-    
-    # 2. Merging
-    # Combine all into one timeline
-    # We prioritize daily_logs_df for overlap periods as it has more columns (macros, hips)
-    
-    all_data = pd.concat([weight_df, measurements_df, daily_logs_df], ignore_index=True)
-    
-    # Sort by date
-    all_data = all_data.sort_values(by='date')
-    
-    # Consolidate by date.
-    # We want to keep non-null values. 
-    # If there are duplicates, we generally trust the 'daily_log' most as it's the most recent and detailed.
-    # Group by date and take the first non-null. 
-    # Since we prioritize daily_logs, let's sort such that daily_log comes first for same dates?
-    # Actually, groupby().first() takes the first appearing value.
-    # So if we concatenate daily_logs LAST, and then sort by date, 
-    # the order within the same date is unstable unless we explicit sort.
-    
-    # Better approach: Sort by Date, then by some priority? 
-    # Or just rely on the fact that daily_logs is dense.
-    
-    consolidated = all_data.groupby('date').last().reset_index() # using last() might be safer if we append daily_logs last?
+
+# ─── Partitioned store ───────────────────────────────────────
+
+def write_partitions(consolidated, years=None):
+    """Write one CSV + JSON (+ typed Parquet) file per year (only `years`, if given)."""
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    # to_datetime: an empty frame (no exports yet) has an untyped date column
+    for year, part in consolidated.groupby(pd.to_datetime(consolidated['date']).dt.year):
+        if years is not None and year not in years:
+            continue
+        part.to_csv(partition_path(year, 'csv'), index=False)
+        # The JSON export feeds the app, which has no use for provenance
+        part[COLUMNS].to_json(partition_path(year, 'json'), orient='records', date_format='iso')
+        write_parquet_partition(part, year)
+
+
+def read_partitions(years):
+    frames = []
+    for year in sorted(years):
+        path = partition_path(year, 'csv')
+        if os.path.exists(path):
+            df = pd.read_csv(path, dtype={c: object for c in ['notes', 'type'] + PROVENANCE_COLUMNS})
+            df['date'] = pd.to_datetime(df['date'])
+            frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS).astype({'date': 'datetime64[ns]'})
+
+
+def partitions_have_provenance():
+    """False for stores written before provenance columns existed (needs a rebuild)."""
+    years = partition_years()
+    if not years:
+        return True
+    with open(partition_path(years[0], 'csv'), 'r') as f:
+        return PROVENANCE_COLUMNS[0] in f.readline().strip().split(',')
+
+
+def stitch_exports():
+    """Rebuild the monolithic CSV/JSON exports by concatenating partition files.
+
+    This is plain text concatenation, no parsing, so it stays cheap even
+    though it touches every partition.
+    """
+    years = partition_years()
+    with open('consolidated_health_data.csv', 'w') as out:
+        for i, year in enumerate(years):
+            with open(partition_path(year, 'csv'), 'r') as f:
+                lines = f.readlines()
+            out.writelines(lines if i == 0 else lines[1:])
+    with open('consolidated_health_data.json', 'w') as out:
+        bodies = []
+        for year in years:
+            with open(partition_path(year, 'json'), 'r') as f:
+                body = f.read().strip()[1:-1]
+            if body:
+                bodies.append(body)
+        out.write('[' + ','.join(bodies) + ']')
+
+
+def push_stats(stats, rows):
+    """Feed date-sorted consolidated rows (one per date) into RollingStats."""
+    metrics = ['weight'] + list(rolling_stats.WINDOWS)
+    values = rows[metrics].astype('float64').itertuples(index=False)
+    for day, row in zip(rows['date'].dt.strftime('%Y-%m-%d'), values):
+        stats.push(day, {m: None if np.isnan(v) else v for m, v in zip(metrics, row)})
+    return stats
+
+
+def update_stats(merged, new_dates):
+    """Extend the saved rolling stats with newly appended dates.
+
+    O(new rows) when every new date is after the last one in the stats;
+    otherwise (a backfilled day) the stats are rebuilt from all partitions.
+    """
+    stats = rolling_stats.load(STATS_FILE)
+    if stats is not None and new_dates.min() > pd.Timestamp(stats.last_date):
+        push_stats(stats, merged[merged['date'].isin(new_dates)])
+    else:
+        stats = push_stats(rolling_stats.RollingStats(), read_partitions(partition_years()))
+    rolling_stats.save(stats, STATS_FILE)
+
+
+def full_rebuild():
+    """Parse every raw export and rewrite the whole store."""
+    state = {}
+    for name, (path, _, header_lines) in SOURCES.items():
+        if os.path.exists(path):
+            state[name] = source_state(path, count_rows(path, header_lines))
+    # Chunks stream straight from the readers into the fold, in SOURCES order
+    consolidated = consolidate(chain.from_iterable(
+        globals()[iter_chunks](path) for path, iter_chunks, _ in SOURCES.values()))
+
+    for ext in ('csv', 'json', 'parquet'):
+        for year in partition_years(ext=ext):
+            os.remove(partition_path(year, ext))
+    write_partitions(consolidated)
+    rolling_stats.save(push_stats(rolling_stats.RollingStats(), consolidated), STATS_FILE)
+    save_state(state)
+    stitch_exports()
+    write_frame_snapshot(consolidated)
+    return consolidated
+
+
+def incremental_update():
+    """Parse only rows appended to the raw exports and merge them by date.
+
+    Returns (new_rows, affected_years), or None if a full rebuild is needed.
+    """
+    state = load_state()
+    if not partitions_have_provenance():
+        return None
+    frames, new_state = [], {}
+    for name, (path, iter_chunks, header_lines) in SOURCES.items():
+        if not os.path.exists(path):
+            continue
+        old = state.get(name)
+        if old is None:
+            return None
+        if os.path.getsize(path) == old['size'] and file_digest(path) == old['sha256']:
+            new_state[name] = old
+            continue
+        new_rows = read_appended(path, globals()[iter_chunks], header_lines, old)
+        if new_rows is None:
+            return None
+        frames.append(new_rows)
+        new_state[name] = source_state(path, old['rows'] + len(new_rows))
+
+    new_rows = pd.concat([f for f in frames if not f.empty], ignore_index=True) \
+        if any(not f.empty for f in frames) else pd.DataFrame(columns=COLUMNS)
+    years = {int(y) for y in new_rows['date'].dt.year.unique()} if not new_rows.empty else set()
+    if years:
+        # Existing rows come first so newly appended values win, as in a full run
+        existing = read_partitions(years)
+        merged = consolidate([existing, new_rows])
+        write_partitions(merged, years)
+        update_stats(merged, new_rows['date'].unique())
+        stitch_exports()
+        if os.path.exists(SNAPSHOT_FILE):
+            write_frame_snapshot(merged, years=years)
+        else:  # a store from before the snapshot existed
+            write_frame_snapshot(read_partitions(partition_years()))
+    save_state(new_state)
+    return new_rows, sorted(years)
+
+
+def main(incremental=False):
+    # 1. Loading + 2. Merging
+    if incremental and os.path.exists(STATE_FILE):
+        result = incremental_update()
+        if result is not None:
+            new_rows, years = result
+            print(f"Incremental update: {len(new_rows)} new rows, rewrote partitions {years or 'none'}")
+            return
+        print("Raw exports changed in place (or the store predates provenance), falling back to a full rebuild")
+
+    consolidated = full_rebuild()
     
     # 3. Validation / Basic Stats
     print(f"Total entries: {len(consolidated)}")
@@ -188,14 +545,15 @@ def main():
     print(f"Rows with waist: {consolidated.get('waist_cm', pd.Series()).count()}")
     print(f"Rows with hip: {consolidated.get('hips_cm', pd.Series()).count()}")
     print(f"Rows with calories: {consolidated.get('calories', pd.Series()).count()}")
+    print(f"Weight values by source: {consolidated['weight_source'].value_counts().to_dict()}")
 
-    # 4. Save to JSON and CSV
-    consolidated.to_json('consolidated_health_data.json', orient='records', date_format='iso')
-    consolidated.to_csv('consolidated_health_data.csv', index=False)
-    
     # print head
     print("\nSample Data:")
     print(consolidated.tail(10))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Consolidate raw health exports into one timeline.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only parse rows appended since the last run and rewrite the affected years")
+    args = parser.parse_args()
+    main(incremental=args.incremental)
@@ -0,0 +1,209 @@
+"""Online trend statistics, updated in O(1) per new day.
+
+RollingStats consumes days in date order and keeps running aggregates, so
+dashboards and reports can read trend values without rescanning history:
+
+    trend           EWMA of weight (gaps between weigh-ins decay the old trend)
+    rolling         7- and 28-day means of calories and protein
+    recent_logs     calorie and protein means over the last 7 days with either logged
+    weekly          last weight of each recent week (Monday start) and its delta
+    yearly          min / max / mean weight per year
+
+Feeding a day older than the last one is an error; callers rebuild from the
+full history in that case (an edit of a past day or a deletion). The last day
+can be fed again, replacing it, if it was pushed with replaceable=True (the
+state before it is kept, so the replacement is O(1) too). The state
+round-trips through to_dict()/from_dict() as JSON.
+"""
+import json
+from collections import deque
+from copy import deepcopy
+from datetime import date
+
+from storage import to_number, write_data
+
+# Smoothing factor of the weight trend per day (the Hacker's Diet uses 0.1)
+TREND_ALPHA = 0.1
+# Trailing windows (days) kept per metric
+WINDOWS = {'calories': (7, 28), 'protein_g': (7, 28)}
+# Weeks of weekly deltas kept
+WEEKS_KEPT = 26
+# Days with macros logged behind the dashboard's averages (the app's local fallback uses the same)
+RECENT_LOGS = 7
+
+
+class WindowMean:
+    """Mean of the values logged in the trailing `days` days (running sum over a deque)."""
+
+    def __init__(self, days):
+        self.days = days
+        self.values = deque()   # (day ordinal, value)
+        self.total = 0.0
+
+    def push(self, day, value):
+        self.values.append((day, value))
+        self.total += value
+        self.expire(day)
+
+    def expire(self, day):
+        while self.values and self.values[0][0] <= day - self.days:
+            self.total -= self.values.popleft()[1]
+
+    @property
+    def mean(self):
+        return round(self.total / len(self.values), 1) if self.values else None
+
+
+class RollingStats:
+    def __init__(self, alpha=TREND_ALPHA):
+        self.alpha = alpha
+        self.last_day = None        # ordinal of the last day pushed
+        self.trend = None           # (ordinal, EWMA weight)
+        self.latest_weight = None
+        self.windows = {m: {d: WindowMean(d) for d in days} for m, days in WINDOWS.items()}
+        self.weeks = deque(maxlen=WEEKS_KEPT)   # [week start ordinal, last weight]
+        self.years = {}             # year -> [min, max, sum, count]
+        self.recent_logs = deque(maxlen=RECENT_LOGS)   # [calories, protein] of the last days with either
+        self._before_last = None    # state before the last day, if it can be replaced
+
+    @property
+    def last_date(self):
+        return date.fromordinal(self.last_day).isoformat() if self.last_day else ''
+
+    def _state(self):
+        return deepcopy((self.last_day, self.trend, self.latest_weight, self.windows, self.weeks, self.years,
+                         self.recent_logs))
+
+    def push(self, day, values, replaceable=False):
+        """Add one day's values ({'weight': ..., 'calories': ...}; None = not logged).
+
+        With replaceable=True the day can be pushed again to replace its values,
+        until a later day is pushed.
+        """
+        day = date.fromisoformat(str(day)[:10])
+        ordinal = day.toordinal()
+        if ordinal == self.last_day and self._before_last is not None:
+            (self.last_day, self.trend, self.latest_weight, self.windows, self.weeks, self.years,
+             self.recent_logs) = self._before_last
+        elif self.last_day is not None and ordinal <= self.last_day:
+            raise ValueError(f'{day} is not after the last day pushed ({self.last_date})')
+        self._before_last = self._state() if replaceable else None
+        self.last_day = ordinal
+
+        for metric, windows in self.windows.items():
+            value = values.get(metric)
+            for window in windows.values():
+                if value is not None:
+                    window.push(ordinal, value)
+                else:
+                    window.expire(ordinal)
+        calories, protein = values.get('calories'), values.get('protein_g')
+        if calories or protein:
+            self.recent_logs.append([calories or 0.0, protein or 0.0])
+
+        weight = values.get('weight')
+        if weight is None:
+            return
+        self.latest_weight = weight
+        if self.trend is None:
+            self.trend = (ordinal, weight)
+        else:
+            # Equivalent to one EWMA step per elapsed day with the weigh-in held constant
+            since, trend = self.trend
+            weight_of_new = 1 - (1 - self.alpha) ** (ordinal - since)
+            self.trend = (ordinal, trend + weight_of_new * (weight - trend))
+
+        week = ordinal - day.weekday()
+        if self.weeks and self.weeks[-1][0] == week:
+            self.weeks[-1][1] = weight
+        else:
+            self.weeks.append([week, weight])
+
+        year = self.years.get(day.year)
+        if year is None:
+            self.years[day.year] = [weight, weight, weight, 1]
+        else:
+            year[0] = min(year[0], weight)
+            year[1] = max(year[1], weight)
+            year[2] += weight
+            year[3] += 1
+
+    def push_entry(self, entry, replaceable=False):
+        """Add an API entry (a dict with `date` and raw metric fields)."""
+        metrics = ['weight'] + list(self.windows)
+        self.push(entry['date'], {m: to_number(entry.get(m)) for m in metrics}, replaceable)
+
+    def recent_means(self):
+        """Calorie and protein means over the last RECENT_LOGS days with either logged (missing = 0)."""
+        n = len(self.recent_logs)
+        means = {m: round(sum(log[i] for log in self.recent_logs) / n, 1) if n else None
+                 for i, m in enumerate(('calories', 'protein_g'))}
+        return {'days': n, **means}
+
+    def summary(self, weeks=12):
+        weekly = list(self.weeks)[-(weeks + 1):]
+        return {
+            'as_of': self.last_date or None,
+            'latest_weight': self.latest_weight,
+            'trend_weight': round(self.trend[1], 2) if self.trend else None,
+            'rolling': {m: {f'{d}d': w.mean for d, w in windows.items()} for m, windows in self.windows.items()},
+            'recent_logs': self.recent_means(),
+            'weekly': [{'week': date.fromordinal(wk).isoformat(), 'weight': w,
+                        'delta': round(w - weekly[i - 1][1], 2) if i else None}
+                       for i, (wk, w) in enumerate(weekly)][-weeks:],
+            'yearly': {str(y): {'min': v[0], 'max': v[1], 'mean': round(v[2] / v[3], 1), 'count': v[3],
+                                'swing': round(v[1] - v[0], 2)}
+                       for y, v in sorted(self.years.items())},
+        }
+
+    # ── Persistence ──
+
+    def to_dict(self):
+        return {
+            'alpha': self.alpha,
+            'last_day': self.last_day,
+            'trend': self.trend,
+            'latest_weight': self.latest_weight,
+            'windows': {m: {str(d): list(w.values) for d, w in windows.items()}
+                        for m, windows in self.windows.items()},
+            'weeks': list(self.weeks),
+            'years': {str(y): v for y, v in self.years.items()},
+            'recent_logs': list(self.recent_logs),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls(state['alpha'])
+        stats.last_day = state['last_day']
+        stats.trend = tuple(state['trend']) if state['trend'] else None
+        stats.latest_weight = state['latest_weight']
+        for metric, windows in stats.windows.items():
+            for days, window in windows.items():
+                for day, value in state['windows'].get(metric, {}).get(str(days), []):
+                    window.values.append((day, value))
+                    window.total += value
+        stats.weeks.extend(state['weeks'])
+        stats.years = {int(y): v for y, v in state['years'].items()}
+        stats.recent_logs.extend(state['recent_logs'])
+        return stats
+
+
+def build(entries):
+    """RollingStats over date-sorted API entries; the last one stays replaceable."""
+    stats = RollingStats()
+    for i, entry in enumerate(entries):
+        stats.push_entry(entry, replaceable=i == len(entries) - 1)
+    return stats
+
+
+def save(stats, path):
+    write_data(path, stats.to_dict())
+
+
+def load(path):
+    """Saved RollingStats, or None if there is no (readable) state file."""
+    try:
+        with open(path, 'r') as f:
+            return RollingStats.from_dict(json.load(f))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
@@ -0,0 +1,76 @@
+"""Run every analysis report over one load of the consolidated data.
+
+    python run_reports.py                       # all reports, in order
+    python run_reports.py macros bodyfat        # a subset
+    python run_reports.py --parallel            # one worker process per report
+
+The data is loaded once into a metrics.Timeline and shared by all reports.
+With --parallel, reports run in worker processes; on platforms that fork,
+the workers inherit the already-loaded timeline instead of reloading it.
+Each report's output is captured and printed in order either way.
+"""
+import argparse
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from analyze_composition import analyze_composition_change
+from analyze_health_data import analyze_health_data
+from analyze_macros import analyze_macros
+from estimate_bodyfat import estimate_body_fat
+from metrics import Timeline
+
+REPORTS = {
+    'general': ('General Statistics', analyze_health_data),
+    'macros': ('Macro Adherence', analyze_macros),
+    'composition': ('Body Composition', lambda timeline: analyze_composition_change(timeline=timeline)),
+    'bodyfat': ('Body Fat Estimate', estimate_body_fat),
+}
+
+# Set before the worker pool starts so forked workers share it
+_timeline = None
+
+
+def run_report(name):
+    """Run one report against the shared timeline and return its printed output."""
+    global _timeline
+    if _timeline is None:  # spawned worker: nothing inherited, load our own
+        _timeline = Timeline()
+    out = io.StringIO()
+    with redirect_stdout(out):
+        REPORTS[name][1](_timeline)
+    return out.getvalue()
+
+
+def run_reports(names=None, parallel=False):
+    global _timeline
+    names = names or list(REPORTS)
+    start = time.perf_counter()
+    _timeline = Timeline()
+    loaded = time.perf_counter()
+
+    if parallel:
+        with ProcessPoolExecutor(max_workers=len(names)) as pool:
+            outputs = list(pool.map(run_report, names))
+    else:
+        outputs = [run_report(name) for name in names]
+
+    for name, output in zip(names, outputs):
+        title = REPORTS[name][0]
+        print(f"\n{'=' * 20} {title} {'=' * (58 - len(title))}")
+        print(output, end='')
+    done = time.perf_counter()
+    print(f"\n{len(names)} reports: load {loaded - start:.2f}s, reports {done - loaded:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analysis reports over one load of the data.")
+    parser.add_argument('reports', nargs='*', metavar='REPORT',
+                        help=f"reports to run: {', '.join(REPORTS)} (default: all)")
+    parser.add_argument('--parallel', action='store_true', help="run the reports in parallel worker processes")
+    args = parser.parse_args()
+    unknown = [name for name in args.reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"unknown report(s): {', '.join(unknown)} (choose from {', '.join(REPORTS)})")
+    run_reports(args.reports, args.parallel)
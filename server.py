@@ -1,100 +1,936 @@
 """HealthOS API — lightweight Flask server for GitHub deployment."""
-import json
+import atexit
+import gzip
+import hashlib
 import os
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+import re
+import threading
+import time
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from itertools import islice
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 
-app = Flask(__name__,
-    static_folder='.' if os.path.isdir('.') else '.',
-    static_url_path=''
-)
+import columnar
+import downsample
+import estimate_bodyfat
+import health_store
+import jobs
+import rolling_stats
+import telemetry
+import storage
+from storage import ConflictError, DataStore, date_key, to_number
+from telemetry import phase
+
+try:
+    import brotli
+except ImportError:  # optional: fall back to gzip only
+    brotli = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() and request.get_json() through orjson (same sorted, compact output)."""
+
+    def dumps(self, obj, **kwargs):
+        option = storage.orjson.OPT_SORT_KEYS | storage.orjson.OPT_PASSTHROUGH_DATETIME
+        return storage.orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return storage.orjson.loads(s)
+
+
+# No Flask static folder: static_files() below serves only the app's own files
+app = Flask(__name__, static_folder=None)
+if storage.orjson is not None:
+    app.json = FastJSONProvider(app)
 
 DATA_DIR = os.environ.get('DATA_DIR', './data')
-DATA_FILE = os.path.join(DATA_DIR, 'healthos_data.json')
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+
+# ─── Encoded payloads ────────────────────────────────────────
+# GET /api/data bodies are encoded (and compressed) once per dataset revision
+# and reused until the data changes. The ETag is derived from the revision,
+# so unchanged pulls are answered with a bodyless 304. Clients that send
+# Accept: application/vnd.healthos.columnar+json get the columnar format
+# (see columnar.py) instead of an array of entries.
+
+# Body format -> (mimetype, encoder)
+FORMATS = {
+    'json': ('application/json', lambda entries: entries),
+    'columnar': (columnar.MIMETYPE, columnar.encode),
+}
+
+def negotiate_encoding():
+    """Best Content-Encoding we can produce for this request's Accept-Encoding."""
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality('br') > 0:
+        return 'br'
+    if accept.quality('gzip') > 0:
+        return 'gzip'
+    return 'identity'
+
+
+def negotiate_format():
+    """'columnar' if the client prefers it over plain JSON, else 'json'."""
+    best = request.accept_mimetypes.best_match(['application/json', columnar.MIMETYPE])
+    return 'columnar' if best == columnar.MIMETYPE else 'json'
+
+
+def encode_body(entries, fmt):
+    with phase('serialize'):
+        return storage.dumps(FORMATS[fmt][1](entries))
+
+
+def compress(body, encoding):
+    if encoding == 'identity':
+        return body
+    with phase('compress'):
+        if encoding == 'br':
+            return brotli.compress(body, quality=5)
+        return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class PayloadCache:
+    """Encoded response bodies for the current revision, one per (format, content encoding)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revision = None
+        self._bodies = {}
+
+    def get(self, revision, entries, encoding, fmt='json'):
+        with self._lock:
+            if revision != self._revision:
+                self._revision = revision
+                self._bodies = {}
+            if (fmt, 'identity') not in self._bodies:
+                self._bodies[fmt, 'identity'] = encode_body(entries, fmt)
+                telemetry.PAYLOAD_BYTES.set(len(self._bodies[fmt, 'identity']), format=fmt, encoding='identity')
+            if len(self._bodies[fmt, 'identity']) < COMPRESS_MIN_BYTES:
+                encoding = 'identity'
+            if (fmt, encoding) not in self._bodies:
+                self._bodies[fmt, encoding] = compress(self._bodies[fmt, 'identity'], encoding)
+                telemetry.PAYLOAD_BYTES.set(len(self._bodies[fmt, encoding]), format=fmt, encoding=encoding)
+            return encoding, self._bodies[fmt, encoding]
+
+
+def etag_for(revision, encoding, fmt='json'):
+    # Strong validators must differ per representation, so format and encoding are part of the tag
+    tag = f'r{revision}' if fmt == 'json' else f'r{revision}-{fmt}'
+    return tag if encoding == 'identity' else f'{tag}-{encoding}'
+
+
+# ─── Aggregated series ───────────────────────────────────────
+# Charts ask for pre-aggregated buckets instead of every raw point, so the
+# payload stays the same size however many years of history there are.
+
+METRICS = ('weight', 'waist_cm', 'hips_cm', 'biceps_l', 'biceps_r',
+           'calories', 'protein_g', 'carbs_g', 'fat_g')
+# Entry fields GET /api/data?fields= can project
+QUERY_FIELDS = METRICS + ('notes', 'type')
+# Upper bound on points returned for bucket=none, whatever width is asked for
+MAX_SERIES_POINTS = 500
+
+
+def bucket_start(day, bucket):
+    """First day of the week (Monday), month or year containing `day`."""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def aggregate_series(entries, metric, bucket):
+    """Per-bucket min/max/mean/last/count of `metric` over date-sorted entries."""
+    points = []
+    current = None
+    for entry in entries:
+        value = to_number(entry.get(metric))
+        if value is None:
+            continue
+        start = bucket_start(date.fromisoformat(str(entry['date'])[:10]), bucket)
+        if current is None or current['start'] != start:
+            current = {'start': start, 'min': value, 'max': value, 'sum': 0.0, 'count': 0}
+            points.append(current)
+        current['min'] = min(current['min'], value)
+        current['max'] = max(current['max'], value)
+        current['sum'] += value
+        current['count'] += 1
+        current['last'] = value
+    return [{
+        'start': p['start'].isoformat(),
+        'min': p['min'],
+        'max': p['max'],
+        'mean': round(p['sum'] / p['count'], 2),
+        'last': p['last'],
+        'count': p['count'],
+    } for p in points]
+
+
+def raw_series(entries, metric):
+    """Date-sorted (dates, values) of every entry that has `metric`."""
+    points = [(str(e['date'])[:10], to_number(e.get(metric))) for e in entries]
+    points = [(d, v) for d, v in points if v is not None]
+    return [d for d, _ in points], [v for _, v in points]
+
+
+class RevisionCache:
+    """Memoizes derived results for the current dataset revision only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revision = None
+        self._results = {}
+
+    def get(self, revision, key, build):
+        with self._lock:
+            if revision != self._revision:
+                self._revision = revision
+                self._results = {}
+            if key not in self._results:
+                self._results[key] = build()
+            return self._results[key]
+
+
+# ─── Rolling stats ───────────────────────────────────────────
+# Trend weight, 7/28-day macro means, weekly deltas and yearly ranges (see
+# rolling_stats.py) catch up with the writes made since the last /api/stats
+# read, so neither writes nor reads rescan the history when days are appended
+# or the latest day is edited.
+
+class LiveStats:
+    """RollingStats following the store, brought up to date when read.
+
+    Entries for the last day seen and later are pushed in O(1) each (the last
+    day is replaced); edits of earlier days and deletions rebuild from the
+    full history.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self._revision = None
+        self._stats = None
 
-def read_data():
-    """Read health data from disk."""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    def get(self):
+        store = self._store
+        with self._lock:
+            if self._stats is not None and self._revision != store.revision:
+                changes = store.changes_since(self._revision)
+                last = self._stats.last_date
+                if not changes.get('full') and not changes['deleted'] and all(date_key(e) >= last for e in changes['entries']):
+                    for entry in changes['entries']:
+                        self._stats.push_entry(entry, replaceable=True)
+                    self._revision = changes['revision']
+                else:
+                    self._stats = None
+            if self._stats is None:
+                self._revision, entries = store.snapshot()
+                self._stats = rolling_stats.build(entries)
+            return self._revision, self._stats.summary()
 
 
-def write_data(data):
-    """Write health data to disk (atomically)."""
-    tmp = DATA_FILE + '.tmp'
-    with open(tmp, 'w') as f:
-        json.dump(data, f, indent=2)
-    os.replace(tmp, DATA_FILE)  # atomic on POSIX
+# ─── Users ───────────────────────────────────────────────────
+# One instance can serve a household or a coaching group. Each user key gets
+# its own partition under DATA_DIR/users/<key>/ with its own snapshot,
+# journal, file lock and caches, so a request only touches that user's data.
+# Requests without a key use DATA_DIR itself (the single-user layout). The key
+# routes requests, it does not authenticate them: put the server behind a
+# proxy that does.
+
+USER_HEADER = 'X-HealthOS-User'
+USER_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Users kept in memory at once; the least recently used one is compacted and dropped
+MAX_LOADED_USERS = int(os.environ.get('MAX_LOADED_USERS', '64'))
+
+
+class UserData:
+    """Store and caches for one user's partition.
+
+    Entries carry a `_rev` (see storage.py) so clients can pull just what
+    changed after the revision they last saw.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.store = DataStore(data_dir)
+        self.payloads = PayloadCache()
+        self.derived = RevisionCache()
+        self.stats = LiveStats(self.store)
+
+    def warm(self):
+        """Build what the dashboard asks for on load: stats, body fat and every /api/data body."""
+        revision, entries = self.store.snapshot()
+        self.stats.get()
+        heights = (estimate_bodyfat.HEIGHT_CM,)
+        self.derived.get(revision, ('bodyfat', None, heights), lambda: body_fat_points(entries, None, heights))
+        for fmt in FORMATS:
+            for encoding in ('identity', 'gzip') + (('br',) if brotli is not None else ()):
+                self.payloads.get(revision, entries, encoding, fmt)
+
+
+class UserRegistry:
+    """Loaded UserData by key, least recently used first."""
+
+    def __init__(self, max_loaded=MAX_LOADED_USERS):
+        self.max_loaded = max_loaded
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, key=None, create=True):
+        """The user's data; with create=False an unknown key whose partition doesn't
+        exist yet gets an empty, unregistered view, so reads never create partitions
+        or push real users out."""
+        evicted = []
+        with self._lock:
+            user = self._users.get(key)
+            if user is None:
+                data_dir = DATA_DIR if key is None else os.path.join(DATA_DIR, 'users', key)
+                if not create and key is not None and not os.path.isdir(data_dir):
+                    return UserData(data_dir)
+                user = self._users[key] = UserData(data_dir)
+                while len(self._users) > self.max_loaded:
+                    evicted.append(self._users.popitem(last=False)[1])
+            else:
+                self._users.move_to_end(key)
+        if evicted:
+            # Fold evicted journals into their snapshots so a later reload is one read,
+            # off the request thread so no request pays for another user's data
+            threading.Thread(target=self._compact, args=(evicted,), name='healthos-evict', daemon=True).start()
+        return user
+
+    @staticmethod
+    def _compact(evicted):
+        for old in evicted:
+            old.store.compact()
+
+    def loaded(self):
+        with self._lock:
+            return list(self._users.values())
+
+    def compact_all(self):
+        for user in self.loaded():
+            user.store.compact()
+
+
+users = UserRegistry()
+atexit.register(users.compact_all)
+
+
+# ─── Metrics ─────────────────────────────────────────────────
+# Every request is timed into per-endpoint histograms, and storage and
+# encoding time their phases (see telemetry.py); GET /api/metrics exposes it
+# all in the Prometheus text format. The sampling profiler exposes stack
+# frames, so /api/profile only exists when PROFILE_ENABLED is set; then it can
+# be switched on with POST /api/profile, or at boot with PROFILE_INTERVAL_MS
+# (see start_profiler).
+
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+telemetry.registry.add(telemetry.Gauge(
+    'healthos_entries', 'Entries across the loaded partitions.',
+    read=lambda: sum(len(user.store) for user in users.loaded())))
+telemetry.registry.add(telemetry.Gauge(
+    'healthos_users_loaded', 'Partitions held in memory.', read=lambda: len(users.loaded())))
+
+
+def start_profiler():
+    """Start sampling at boot if PROFILE_INTERVAL_MS asks for it (called in each serving process)."""
+    if PROFILE_ENABLED and os.environ.get('PROFILE_INTERVAL_MS'):
+        telemetry.sampler.start(float(os.environ['PROFILE_INTERVAL_MS']) / 1000)
+
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    telemetry.sampler.track(threading.get_ident())
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    telemetry.REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=endpoint,
+                                      method=request.method, status=response.status_code)
+    if not response.is_streamed:
+        telemetry.RESPONSE_BYTES.observe(response.content_length or 0, endpoint=endpoint)
+    return response
+
+
+@app.teardown_request
+def stop_tracking(exc):
+    telemetry.sampler.untrack(threading.get_ident())
+
+
+@app.before_request
+def resolve_user():
+    """Route API requests to the partition named by X-HealthOS-User (or ?user=)."""
+    if not request.path.startswith('/api/'):
+        return None
+    key = request.headers.get(USER_HEADER) or request.args.get('user')
+    if key is not None and not USER_KEY_RE.match(key):
+        return jsonify({'error': 'Expected a user key of 1-64 letters, digits, - or _'}), 400
+    g.user = users.get(key, create=request.method not in ('GET', 'HEAD', 'OPTIONS'))
 
 
 # ─── API Routes ──────────────────────────────────────────────
 
 @app.route('/api/data', methods=['GET'])
 def get_data():
-    """Return all health data."""
-    data = read_data()
-    return jsonify(data)
+    """Return all health data, or only what changed after ?since=<revision>."""
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return jsonify(g.user.store.changes_since(since))
+    if any(arg in request.args for arg in ('from', 'to', 'fields', 'limit')):
+        return query_data()
+
+    revision, entries = g.user.store.snapshot()
+    fmt = negotiate_format()
+    headers = {
+        'X-HealthOS-Revision': str(revision),
+        'Vary': f'Accept, Accept-Encoding, {USER_HEADER}',
+        'Cache-Control': 'no-cache',
+    }
+    # Any content encoding of this revision is still current for the client
+    if any(etag_for(revision, enc, fmt) in request.if_none_match for enc in ('identity', 'gzip', 'br')):
+        headers['ETag'] = f'"{etag_for(revision, negotiate_encoding(), fmt)}"'
+        return Response(status=304, headers=headers)
+
+    encoding, body = g.user.payloads.get(revision, entries, negotiate_encoding(), fmt)
+    headers['ETag'] = f'"{etag_for(revision, encoding, fmt)}"'
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype=FORMATS[fmt][0], headers=headers)
+
+
+def query_data():
+    """GET /api/data?from=&to=&fields=weight,waist_cm&limit=: a date range, projected.
+
+    The range is two bisects over the store's sorted date index. With fields,
+    entries carry only `date` plus those fields, and entries that have none
+    of them are skipped. limit keeps the most recent N matches (still
+    returned oldest first), so only those are ever projected.
+    """
+    try:
+        start = date.fromisoformat(request.args['from']).isoformat() if request.args.get('from') else None
+        end = date.fromisoformat(request.args['to']).isoformat() if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Expected from/to as YYYY-MM-DD'}), 400
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    unknown = [f for f in fields if f not in QUERY_FIELDS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields {", ".join(unknown)}, expected any of: {", ".join(QUERY_FIELDS)}'}), 400
+    limit = request.args.get('limit', type=int)
+    if 'limit' in request.args and (limit is None or limit < 1):
+        return jsonify({'error': 'Expected limit as a positive integer'}), 400
+
+    revision, entries = g.user.store.query(start, end)
+    matches = reversed(entries)
+    if fields:
+        projected = ({'date': e['date'], **{f: e[f] for f in fields if e.get(f) not in (None, '')}}
+                     for e in matches)
+        matches = (e for e in projected if len(e) > 1)
+    result = list(islice(matches, limit))
+    result.reverse()
+    fmt = negotiate_format()
+    return Response(encode_body(result, fmt), mimetype=FORMATS[fmt][0], headers={
+        'X-HealthOS-Revision': str(revision),
+        'Vary': f'Accept, {USER_HEADER}',
+        'Cache-Control': 'no-cache',
+    })
+
+
+def valid_entry(entry):
+    """An object whose date is YYYY-MM-DD (or an ISO timestamp starting with one)."""
+    if not isinstance(entry, dict):
+        return False
+    try:
+        date.fromisoformat(date_key(entry))
+    except ValueError:
+        return False
+    return True
+
+
+def write_entries(changes, replace=False):
+    """Apply a write, conditional on If-Match ("r42", or any of our ETags for that revision).
+
+    Returns (response, status): the usual ok body, or a 409 listing the dates
+    that changed since the client's revision so it can reconcile just those.
+    """
+    if not all(valid_entry(e) for e in changes):
+        return jsonify({'error': 'Expected JSON array of entries with a YYYY-MM-DD date'}), 400
+    header = request.headers.get('If-Match', '').strip()
+    base = None
+    if header and header != '*':
+        match = re.match(r'^(?:W/)?"?r(\d+)', header)
+        if not match:
+            return jsonify({'error': 'Expected If-Match as a revision, e.g. "r42"'}), 400
+        base = int(match.group(1))
+    try:
+        changed, revision = g.user.store.apply(changes, replace=replace, base=base)
+    except ConflictError as e:
+        return jsonify({'error': 'Data changed since your revision', 'revision': e.revision,
+                        'conflicts': {'entries': e.entries, 'deleted': e.deleted}}), 409
+    return jsonify({'ok': True, 'count': len(g.user.store) if replace else changed, 'revision': revision,
+                    'synced': datetime.utcnow().isoformat() + 'Z'}), 200
 
 
 @app.route('/api/data', methods=['PUT'])
 def put_data():
     """Replace all health data."""
-    data = request.get_json(force=True)
+    with phase('parse'):
+        data = request.get_json(force=True)
     if not isinstance(data, list):
         return jsonify({'error': 'Expected JSON array'}), 400
-    write_data(data)
-    return jsonify({'ok': True, 'count': len(data), 'synced': datetime.utcnow().isoformat() + 'Z'})
+    return write_entries(data, replace=True)
+
+
+@app.route('/api/data', methods=['PATCH'])
+def patch_data():
+    """Upsert a batch of entries keyed by date."""
+    with phase('parse'):
+        changes = request.get_json(force=True)
+    if isinstance(changes, dict):
+        changes = [changes]
+    if not isinstance(changes, list):
+        return jsonify({'error': 'Expected JSON array of entries with a YYYY-MM-DD date'}), 400
+    return write_entries(changes)
+
+
+@app.route('/api/series', methods=['GET'])
+def get_series():
+    """Bucketed aggregates of one metric: ?metric=weight&bucket=week|month|year|none&from=&to="""
+    metric = request.args.get('metric', 'weight')
+    bucket = request.args.get('bucket', 'month')
+    if metric not in METRICS:
+        return jsonify({'error': f'Unknown metric, expected one of: {", ".join(METRICS)}'}), 400
+    if bucket not in ('week', 'month', 'year', 'none'):
+        return jsonify({'error': 'Expected bucket=week, month, year or none'}), 400
+
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Expected from/to as YYYY-MM-DD'}), 400
+
+    revision, entries = g.user.store.snapshot()
+    if bucket == 'none':
+        return get_raw_series(revision, entries, metric, start, end)
+    points = g.user.derived.get(revision, ('series', metric, bucket),
+                         lambda: aggregate_series(entries, metric, bucket))
+
+    # Buckets are date-ordered, so the range is two bisects over their start dates
+    starts = [p['start'] for p in points]
+    lo = bisect_left(starts, bucket_start(start, bucket).isoformat()) if start else 0
+    hi = bisect_right(starts, end.isoformat()) if end else len(points)
+    return jsonify({'metric': metric, 'bucket': bucket, 'revision': revision, 'points': points[lo:hi]})
+
+
+def get_raw_series(revision, entries, metric, start, end):
+    """bucket=none: raw points in range, downsampled for a chart ?width= pixels wide (&mode=lttb|minmax)."""
+    mode = request.args.get('mode', 'lttb')
+    if mode not in downsample.MODES:
+        return jsonify({'error': 'Expected mode=lttb or minmax'}), 400
+    n_out = max(3, min(request.args.get('width', MAX_SERIES_POINTS, type=int), MAX_SERIES_POINTS))
+
+    dates, values = g.user.derived.get(revision, ('raw', metric), lambda: raw_series(entries, metric))
+    lo = bisect_left(dates, start.isoformat()) if start else 0
+    hi = bisect_right(dates, end.isoformat()) if end else len(dates)
+    dates, values = dates[lo:hi], values[lo:hi]
+    points = []
+    if dates:
+        x = [date.fromisoformat(d).toordinal() for d in dates]
+        points = [{'date': dates[i], 'value': values[i]}
+                  for i in downsample.downsample(x, values, n_out, mode)]
+    return jsonify({'metric': metric, 'bucket': 'none', 'mode': mode, 'revision': revision,
+                    'points': points})
+
+
+# Most neck/height values accepted per request (the grid is necks x heights per row)
+MAX_GRID_VALUES = 20
+
+
+def parse_floats(name, default=None):
+    """Comma-separated numbers from query arg `name` as a tuple (or `default` if absent)."""
+    raw = request.args.get(name)
+    if not raw:
+        return default
+    values = tuple(float(v) for v in raw.split(','))
+    if not values or len(values) > MAX_GRID_VALUES:
+        raise ValueError(name)
+    return values
+
+
+def body_fat_points(entries, necks, heights):
+    """(dates, points) of the BF%/lean-mass series over date-sorted entries."""
+    nan = float('nan')
+    weight = [to_number(e.get('weight')) for e in entries]
+    waist = [to_number(e.get('waist_cm')) for e in entries]
+    points = estimate_bodyfat.body_fat_series(
+        [str(e['date'])[:10] for e in entries],
+        [nan if v is None else v for v in weight], [nan if v is None else v for v in waist],
+        necks, heights)
+    return [p['date'] for p in points], points
+
+
+@app.route('/api/bodyfat', methods=['GET'])
+def get_body_fat():
+    """Navy BF% and lean mass for every entry with weight and waist: ?neck=38,40,42&height=183&from=&to="""
+    try:
+        necks = parse_floats('neck')
+        heights = parse_floats('height', (estimate_bodyfat.HEIGHT_CM,))
+        start = request.args.get('from') and date.fromisoformat(request.args['from'])
+        end = request.args.get('to') and date.fromisoformat(request.args['to'])
+    except ValueError:
+        return jsonify({'error': f'Expected neck/height as comma-separated numbers (at most {MAX_GRID_VALUES}) '
+                                 'and from/to as YYYY-MM-DD'}), 400
+
+    revision, entries = g.user.store.snapshot()
+    build = lambda: body_fat_points(entries, necks, heights)
+    if necks is None and heights == (estimate_bodyfat.HEIGHT_CM,):
+        # The dashboard's grid is computed once per revision, then sliced by date. Other
+        # grids are client-chosen, so caching them would grow without bound until the next write
+        dates, points = g.user.derived.get(revision, ('bodyfat', None, heights), build)
+    else:
+        dates, points = build()
+    lo = bisect_left(dates, start.isoformat()) if start else 0
+    hi = bisect_right(dates, end.isoformat()) if end else len(dates)
+    return jsonify({'revision': revision, 'neck': necks or 'estimated', 'height': heights,
+                    'points': points[lo:hi]})
+
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Precomputed trend weight, rolling macro means, weekly deltas and yearly ranges."""
+    revision, summary = g.user.stats.get()
+    return jsonify({'revision': revision, **summary})
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint."""
-    return jsonify({'status': 'ok', 'entries': len(read_data())})
+    return jsonify({'status': 'ok', 'entries': len(g.user.store)})
 
 
-# ─── Seed data on first run ─────────────────────────────────
+# ─── Ingestion jobs ──────────────────────────────────────────
+# Raw exports are uploaded per partition and consolidated by a background
+# job on a process pool (see jobs.py); clients poll /api/jobs/<id>.
+
+job_queue = jobs.JobQueue()
+
+
+@app.route('/api/exports/<name>', methods=['PUT'])
+def put_export(name):
+    """Upload a raw export (the TSV body as-is) and queue a job to consolidate it."""
+    if name not in jobs.EXPORT_FILES:
+        return jsonify({'error': f'Unknown export, expected one of: {", ".join(jobs.EXPORT_FILES)}'}), 404
+    if (request.content_length or 0) > jobs.MAX_EXPORT_BYTES:
+        return jsonify({'error': f'Export larger than {jobs.MAX_EXPORT_BYTES} bytes'}), 413
+    try:
+        jobs.save_export(g.user.data_dir, name, request.stream)
+    except jobs.EmptyExport as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
+    return job_accepted(job_queue.submit(g.user.data_dir, f'upload:{name}'))
+
+
+@app.route('/api/jobs', methods=['POST'])
+def post_job():
+    """Queue a consolidation of the exports already uploaded."""
+    if not jobs.has_exports(g.user.data_dir):
+        return jsonify({'error': 'No exports uploaded yet, PUT /api/exports/<name> first'}), 409
+    return job_accepted(job_queue.submit(g.user.data_dir, 'manual'))
+
+
+def job_accepted(job):
+    return jsonify(job), 202, {'Location': f'/api/jobs/{job["id"]}'}
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a job: queued, running, done or failed."""
+    job = job_queue.status(g.user.data_dir, job_id)
+    if job is None:
+        return jsonify({'error': 'No such job'}), 404
+    headers = {'Cache-Control': 'no-cache'}
+    if job['status'] in ('queued', 'running'):
+        headers['Retry-After'] = '2'
+    return jsonify(job), 200, headers
+
+
+@app.route('/api/reports', methods=['GET'])
+def get_reports():
+    """Report output published by the last finished job."""
+    published = storage.read_data(os.path.join(jobs.pipeline_dir(g.user.data_dir), 'reports.json'))
+    if not published:
+        return jsonify({'error': 'No reports yet, upload exports first'}), 404
+    return jsonify(published)
+
+
+# ─── Timeline snapshot ───────────────────────────────────────
+# Each pipeline run also writes consolidated/timeline.bin (see health_store.py).
+# It is mapped with numpy.memmap, not read: a range query is two binary
+# searches and a slice, and every worker process shares the same pages
+# through the OS page cache.
+
+class SnapshotCache:
+    """Open TimelineSnapshots by path, reopened when the file is replaced.
+
+    At most `max_open` stay mapped (least recently used dropped first), one per
+    loaded user, so mappings and file descriptors don't grow with every user seen.
+    """
+
+    def __init__(self, max_open=MAX_LOADED_USERS):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open = OrderedDict()   # path -> (etag, TimelineSnapshot)
 
-# Use example data for public repository, users can replace with their own data
-EXAMPLE_SEED_FILE = os.path.join(os.path.dirname(__file__), 'example_data.json')
-USER_SEED_FILE = os.path.join(os.path.dirname(__file__), 'data.json')
+    def get(self, path):
+        """(etag, snapshot) for the file at `path`, or None if there is none."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        etag = f'tl-{st.st_mtime_ns:x}-{st.st_size:x}'
+        with self._lock:
+            cached = self._open.get(path)
+            if cached is None or cached[0] != etag:
+                cached = self._open[path] = (etag, health_store.TimelineSnapshot(path))
+            self._open.move_to_end(path)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+            return cached
+
+
+snapshots = SnapshotCache()
+
+
+def timeline_path():
+    path = os.path.join(jobs.pipeline_dir(g.user.data_dir), health_store.SNAPSHOT_FILE)
+    # The default partition falls back to a pipeline run in the working directory
+    if g.user.data_dir == DATA_DIR and not os.path.exists(path):
+        return health_store.SNAPSHOT_FILE
+    return path
+
+
+@app.route('/api/timeline', methods=['GET'])
+def get_timeline():
+    """GET /api/timeline?from=&to=&fields=weight,waist_cm: consolidated metrics, one row per date.
+
+    Served from the binary snapshot; values are null where nothing was logged.
+    """
+    try:
+        start = date.fromisoformat(request.args['from']).isoformat() if request.args.get('from') else None
+        end = date.fromisoformat(request.args['to']).isoformat() if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Expected from/to as YYYY-MM-DD'}), 400
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or list(METRICS)
+    unknown = [f for f in fields if f not in METRICS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields {", ".join(unknown)}, expected any of: {", ".join(METRICS)}'}), 400
+
+    cached = snapshots.get(timeline_path())
+    if cached is None:
+        return jsonify({'error': 'No consolidated timeline yet, upload exports first'}), 404
+    etag, snapshot = cached
+    headers = {'ETag': f'"{etag}"', 'Vary': USER_HEADER, 'Cache-Control': 'no-cache'}
+    # The file is replaced whole, so its tag validates every range and projection of it
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    arrays = snapshot.arrays(fields, start, end)
+    with phase('serialize'):
+        body = storage.dumps({
+            'dates': arrays.pop('date').astype(str).tolist(),
+            # float32 on disk; rounded back to the logged values, NaN -> null
+            'columns': {f: [None if v != v else v for v in values.astype('float64').round(3).tolist()]
+                        for f, values in arrays.items()},
+        })
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request latencies, phase timings and gauges in the Prometheus text format."""
+    return Response(telemetry.registry.render(), content_type=telemetry.CONTENT_TYPE)
+
+
+if PROFILE_ENABLED:
+    @app.route('/api/profile', methods=['GET'])
+    def get_profile():
+        """Folded stacks sampled from request threads (feed to flamegraph.pl or speedscope)."""
+        headers = {f'X-HealthOS-Profile-{k.replace("_", "-").title()}': str(v)
+                   for k, v in telemetry.sampler.summary().items()}
+        return Response(telemetry.sampler.folded(), mimetype='text/plain', headers=headers)
+
+    @app.route('/api/profile', methods=['POST'])
+    def set_profile():
+        """Switch the sampling profiler: {"enabled": true, "interval_ms": 10, "reset": true}"""
+        options = request.get_json(force=True, silent=True)
+        if not isinstance(options, dict) or not isinstance(options.get('enabled'), bool):
+            return jsonify({'error': 'Expected {"enabled": true|false} (optional interval_ms, reset)'}), 400
+        interval = options.get('interval_ms', 10)
+        if not isinstance(interval, (int, float)) or not 1 <= interval <= 1000:
+            return jsonify({'error': 'Expected interval_ms between 1 and 1000'}), 400
+        if options.get('reset'):
+            telemetry.sampler.reset()
+        if options['enabled']:
+            telemetry.sampler.start(interval / 1000)
+        else:
+            telemetry.sampler.stop()
+        return jsonify(telemetry.sampler.summary())
+
+
+# ─── Seed data on first run ─────────────────────────────────
 
 def seed_if_empty():
     """Copy seed data to data volume on first run."""
-    if not os.path.exists(DATA_FILE):
-        # Try user data first, then example data
-        if os.path.exists(USER_SEED_FILE):
-            import shutil
-            shutil.copy2(USER_SEED_FILE, DATA_FILE)
-            print(f'[HealthOS] Seeded data from user data.json')
-        elif os.path.exists(EXAMPLE_SEED_FILE):
-            import shutil
-            shutil.copy2(EXAMPLE_SEED_FILE, DATA_FILE)
-            print(f'[HealthOS] Seeded data from example_data.json (demo data)')
+    if not os.path.exists(os.path.join(DATA_DIR, 'healthos_data.json')):
+        seed = storage.seed_if_empty(DATA_DIR)
+        if seed is not None:
+            print(f'[HealthOS] Seeded data from {os.path.basename(seed)}')
         else:
             print(f'[HealthOS] No seed data found, starting with empty dataset')
 
 
 # ─── Static files (PWA) ─────────────────────────────────────
+# Only the app's own files are served, never the data JSONs or scripts that
+# sit next to them. They are read, hashed and gzipped once and kept in memory
+# (reloaded when one changes on disk). index.html refers to app.js and
+# manifest.json by content hash (?v=<hash>), so those URLs are cached for a
+# year; index.html and sw.js are revalidated on every load.
+
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_FILES = {
+    'index.html': 'text/html',
+    'app.js': 'text/javascript',
+    'sw.js': 'text/javascript',
+    'manifest.json': 'application/manifest+json',
+}
+HASHED_FILES = ('app.js', 'manifest.json')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()[:12]
+
+
+class StaticAssets:
+    """name -> (content hash, {content encoding: body}) for STATIC_FILES."""
+
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._assets = {}
+
+    def _mtime(self, name):
+        try:
+            return os.stat(os.path.join(self.directory, name)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        bodies = {}
+        for name in STATIC_FILES:
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    bodies[name] = f.read()
+            except FileNotFoundError:
+                continue
+        if 'index.html' in bodies:
+            for name in HASHED_FILES:
+                if name in bodies:
+                    bodies['index.html'] = bodies['index.html'].replace(
+                        f'"{name}"'.encode(), f'"{name}?v={content_hash(bodies[name])}"'.encode())
+        self._assets = {name: (content_hash(body), {'identity': body, 'gzip': compress(body, 'gzip')})
+                        for name, body in bodies.items()}
+
+    def get(self, name):
+        mtimes = tuple(self._mtime(n) for n in STATIC_FILES)
+        with self._lock:
+            if mtimes != self._mtimes:
+                self._load()
+                self._mtimes = mtimes
+            return self._assets.get(name)
+
+
+static_assets = StaticAssets()
+
 
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return static_files('index.html')
 
 
 @app.route('/<path:filename>')
 def static_files(filename):
-    return send_from_directory('.', filename)
+    asset = static_assets.get(filename)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    digest, bodies = asset
+    encoding = 'identity'
+    if len(bodies['identity']) >= COMPRESS_MIN_BYTES and request.accept_encodings.quality('gzip') > 0:
+        encoding = 'gzip'
+    response = Response(bodies[encoding], mimetype=STATIC_FILES[filename])
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(digest if encoding == 'identity' else f'{digest}-{encoding}')
+    # A hashed URL names one exact version, so it never needs revalidating
+    hashed = filename in HASHED_FILES and request.args.get('v') == digest
+    response.headers['Cache-Control'] = IMMUTABLE if hashed else 'no-cache'
+    return response.make_conditional(request)
 
 
 # ─── Boot ────────────────────────────────────────────────────
 
-if __name__ == '__main__':
+def recent_user_keys(limit):
+    """Keys of the user partitions on disk, most recently written first."""
+    root = os.path.join(DATA_DIR, 'users')
+    if not os.path.isdir(root):
+        return []
+    written = []
+    for partition in os.scandir(root):
+        if partition.is_dir() and USER_KEY_RE.match(partition.name):
+            mtimes = [f.stat().st_mtime for f in os.scandir(partition.path)] or [partition.stat().st_mtime]
+            written.append((max(mtimes), partition.name))
+    return [key for _, key in sorted(written, reverse=True)[:limit]]
+
+
+def warm_up():
+    """Load partitions and prebuild their caches, so the first requests after a restart are served hot.
+
+    Loads the default partition plus the most recently written user partitions
+    (as many as MAX_LOADED_USERS allows), least recent first so the registry's
+    LRU order matches.
+    """
+    start = time.perf_counter()
+    keys = recent_user_keys(MAX_LOADED_USERS - 1)
+    for key in reversed(keys):
+        users.get(key).warm()
+    users.get().warm()
+    static_assets.get('index.html')
+    print(f'[HealthOS] Warmed {len(keys) + 1} partition(s) in {time.perf_counter() - start:.2f}s')
+
+
+def serve(port=None):
+    """Development server; in production run: gunicorn -c gunicorn.conf.py server:app"""
     seed_if_empty()
-    port = int(os.environ.get('PORT', 5000))
-    print(f'[HealthOS] Server starting on port {port}')
-    app.run(host='0.0.0.0', port=port, debug=False)
+    warm_up()
+    start_profiler()
+    port = port or int(os.environ.get('PORT', 5000))
+    print(f'[HealthOS] Server starting on port {port} (development server)')
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,476 @@
+"""HealthOS storage — JSON snapshot + append-only journal behind the API server.
+
+Layout inside a data directory:
+    healthos_data.json      snapshot: JSON array of entries as of the last compaction
+    healthos_meta.json      revision, deleted dates and the stat of the snapshot it describes
+    healthos_data.journal   one JSON record per changed date since the snapshot
+    healthos_data.lock      flock target shared by every worker process
+
+Writes append their records to the journal (fsync'd) under an exclusive lock,
+so per-write I/O is proportional to the change. A background compaction folds
+the journal back into the snapshot once it grows past COMPACT_EVERY records.
+On start-up (or after a crash) the journal tail is replayed over the snapshot.
+A snapshot whose stat doesn't match the meta file was written by someone else
+(edited by hand, or seeded): it is loaded under a new revision, recorded in
+the meta file so every worker agrees on it.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from telemetry import phase
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: single process, no cross-process locking
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is several times slower on big snapshots
+    orjson = None
+
+# Journal records to accumulate before folding them into the snapshot
+COMPACT_EVERY = int(os.environ.get('COMPACT_EVERY', '500'))
+# Seconds to wait after a write before compacting, so bursts compact once
+COMPACT_DELAY = float(os.environ.get('COMPACT_DELAY', '5.0'))
+# Mode of newly created files (what open() would give them); mkstemp's own is 0600
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+# Copied into an empty data directory on first run: your own data.json, else the demo data
+SEED_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+              for name in ('data.json', 'example_data.json')]
+
+
+def dumps(data):
+    """Compact JSON as bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def loads(raw):
+    """Parse JSON text or bytes, with orjson when it is installed."""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def read_data(path):
+    """Read a JSON snapshot from disk in one read."""
+    if os.path.exists(path):
+        with phase('read'), open(path, 'rb') as f:
+            raw = f.read()
+        with phase('parse'):
+            return loads(raw)
+    return []
+
+
+def write_data(path, data):
+    """Write a compact JSON snapshot to disk (atomically, fsync'd before the rename).
+
+    Each call writes its own uniquely named temp file next to `path`, so
+    concurrent writers (threads or worker processes) never share a temp file;
+    the last rename wins whole.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with phase('serialize'):
+            raw = dumps(data)
+        with os.fdopen(fd, 'wb') as f:
+            with phase('write'):
+                f.write(raw)
+                f.flush()
+            with phase('fsync'):
+                os.fsync(f.fileno())
+        # mkstemp creates 0600: keep the mode of the file we replace, or give a new one the default
+        os.chmod(tmp, os.stat(path).st_mode & 0o777 if os.path.exists(path) else NEW_FILE_MODE)
+        with phase('rename'):
+            os.replace(tmp, path)  # atomic on POSIX
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def date_key(entry):
+    """Normalise an entry's date to YYYY-MM-DD (seed data carries full ISO timestamps)."""
+    return str(entry.get('date', ''))[:10]
+
+
+def to_number(val):
+    """Numeric value of an entry field (older entries store '2,419'-style strings)."""
+    if isinstance(val, (int, float)) and not isinstance(val, bool):
+        return float(val)
+    if isinstance(val, str):
+        try:
+            return float(val.replace(',', ''))
+        except ValueError:
+            return None
+    return None
+
+
+def same_entry(a, b):
+    """Compare two entries ignoring their revision stamps."""
+    return {k: v for k, v in a.items() if k != '_rev'} == {k: v for k, v in b.items() if k != '_rev'}
+
+
+class ConflictError(Exception):
+    """A conditional write touched dates that changed after the writer's base revision.
+
+    `entries` are the current server entries for those dates and `deleted`
+    the dates deleted since, so the client can reconcile just those.
+    """
+
+    def __init__(self, revision, entries, deleted):
+        super().__init__(f'{len(entries) + len(deleted)} conflicting dates')
+        self.revision = revision
+        self.entries = entries
+        self.deleted = deleted
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """Hold an flock on `path` for the duration of the block."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def seed_if_empty(data_dir, seed_files=SEED_FILES):
+    """Copy the first seed file that exists into a data directory without a snapshot.
+
+    Returns the seed file copied, or None. The check and the copy happen under
+    the directory's file lock, so concurrent callers seed it once.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    data_file = os.path.join(data_dir, 'healthos_data.json')
+    with file_lock(os.path.join(data_dir, 'healthos_data.lock')):
+        if os.path.exists(data_file):
+            return None
+        for seed in seed_files:
+            if os.path.exists(seed):
+                shutil.copy2(seed, data_file)
+                return seed
+    return None
+
+
+class DataStore:
+    """In-memory view of one data directory, kept in sync with the journal.
+
+    Reads are answered from memory. Before each access the store stats the
+    snapshot and journal: a new snapshot (another process compacted, or the
+    file was edited by hand) triggers a full reload, a longer journal just
+    replays the new tail. Every entry carries a `_rev` stamped with the
+    dataset revision that last changed it.
+    """
+
+    def __init__(self, data_dir, compact_every=COMPACT_EVERY, compact_delay=COMPACT_DELAY):
+        self.data_dir = data_dir
+        self.data_file = os.path.join(data_dir, 'healthos_data.json')
+        self.meta_file = os.path.join(data_dir, 'healthos_meta.json')
+        self.journal_file = os.path.join(data_dir, 'healthos_data.journal')
+        self.lock_file = os.path.join(data_dir, 'healthos_data.lock')
+        self.compact_every = compact_every
+        self.compact_delay = compact_delay
+        self._lock = threading.RLock()
+        self._timer = None
+        self._snapshot_mtime = -1     # never matches a real stat, forces the first load
+        self._offset = 0              # bytes of the journal already applied
+        self._records = 0             # journal records since the snapshot
+        self._entries = {}            # date -> entry
+        self._deleted = {}            # date -> rev of deletion
+        self._log = OrderedDict()     # date -> rev, oldest change first
+        self._revision = 0
+        self._reset = 0               # revision of the last snapshot replaced from outside
+        self._sorted = None
+        self._dates = []              # sorted date keys, parallel to _sorted
+
+    # ── Loading ──
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None, 0
+
+    def _load(self):
+        """Read the snapshot, then replay the whole journal over it.
+
+        Returns True when the snapshot was replaced from outside: its entries
+        keep their old revs, so the dataset moves to a revision past any seen
+        before (cached bodies and ETags change) and changes_since() answers
+        older revisions with everything.
+        """
+        previous = self._revision
+        data = read_data(self.data_file)
+        meta = read_data(self.meta_file) or {}
+        self._entries = {date_key(e): e for e in data}
+        self._deleted = dict(meta.get('deleted', {}))
+        revs = [(e.get('_rev', 0), k) for k, e in self._entries.items()]
+        revs += [(rev, k) for k, rev in self._deleted.items()]
+        self._log = OrderedDict((k, rev) for rev, k in sorted(revs))
+        self._revision = max([meta.get('revision', 0)] + [rev for rev, _ in revs])
+        self._reset = meta.get('reset', 0)
+        self._sorted = None
+        stat = self._stat(self.data_file)
+        self._snapshot_mtime = stat[0]
+        self._offset = 0
+        self._records = 0
+        self._replay()
+        if stat[0] is None or meta.get('snapshot') == list(stat):
+            return False
+        self._revision = self._reset = max(self._revision, previous) + 1
+        return True
+
+    def _write_meta(self):
+        write_data(self.meta_file, {'revision': self._revision, 'deleted': self._deleted, 'reset': self._reset,
+                                    'snapshot': list(self._stat(self.data_file))})
+
+    def _replay(self, repair=False):
+        """Apply journal records past our offset.
+
+        A torn final record (crash mid-append) is ignored; with repair=True,
+        which callers only pass while holding the exclusive lock, it is also
+        truncated away so the next append starts on a clean line.
+        """
+        if not os.path.exists(self.journal_file):
+            return
+        with phase('read'), open(self.journal_file, 'rb') as f:
+            f.seek(self._offset)
+            tail = f.read()
+        end = tail.rfind(b'\n') + 1
+        with phase('parse'):
+            records = [loads(line) for line in tail[:end].splitlines() if line.strip()]
+        for record in records:
+            self._apply_record(record)
+            self._records += 1
+        self._offset += end
+        if repair and end < len(tail):
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(self._offset)
+
+    def _apply_record(self, record):
+        rev = record['rev']
+        if 'entry' in record:
+            key = date_key(record['entry'])
+            self._entries[key] = record['entry']
+            self._deleted.pop(key, None)
+        else:
+            key = record['deleted']
+            self._entries.pop(key, None)
+            self._deleted[key] = rev
+        self._log[key] = rev
+        self._log.move_to_end(key)
+        self._revision = max(self._revision, rev)
+        self._sorted = None
+
+    def _stale(self):
+        snapshot_mtime = self._stat(self.data_file)[0]
+        journal_size = self._stat(self.journal_file)[1]
+        if snapshot_mtime != self._snapshot_mtime or journal_size < self._offset:
+            return 'reload'
+        if journal_size > self._offset:
+            return 'replay'
+        return None
+
+    def _sync(self, repair=False):
+        """Catch up with the files on disk; the caller holds the exclusive file lock if a reload is due."""
+        if self._stale() == 'reload' and self._load():
+            self._write_meta()
+        self._replay(repair=repair)
+
+    def _refresh(self):
+        """Pick up changes made by other processes (or by hand) since our last look."""
+        stale = self._stale()
+        if stale:
+            if not os.path.isdir(self.data_dir):
+                # Nothing written yet (the first write creates the directory): nothing to lock or read
+                self._load()
+                return
+            # A reload may record a new revision in the meta file (see _load)
+            with file_lock(self.lock_file, exclusive=stale == 'reload'):
+                self._sync()
+
+    def _sorted_entries(self):
+        if self._sorted is None:
+            self._dates = sorted(self._entries)
+            self._sorted = [self._entries[k] for k in self._dates]
+        return self._sorted
+
+    # ── Reads ──
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._entries)
+
+    @property
+    def revision(self):
+        with self._lock:
+            self._refresh()
+            return self._revision
+
+    def entries(self):
+        """All entries sorted by date (the list is rebuilt only after a change)."""
+        with self._lock:
+            self._refresh()
+            return self._sorted_entries()
+
+    def snapshot(self):
+        """(revision, sorted entries) read together, so the pair is consistent."""
+        with self._lock:
+            self._refresh()
+            return self._revision, self._sorted_entries()
+
+    def query(self, start=None, end=None):
+        """(revision, entries dated start..end inclusive), bisected from the sorted date index.
+
+        start/end are YYYY-MM-DD strings; either may be None for an open range.
+        """
+        with self._lock:
+            self._refresh()
+            entries = self._sorted_entries()
+            lo = bisect_left(self._dates, start) if start else 0
+            hi = bisect_right(self._dates, end) if end else len(entries)
+            return self._revision, entries[lo:hi]
+
+    def changes_since(self, since):
+        """Entries and deleted dates whose revision is newer than `since`.
+
+        Walks the change log backwards, so cost is proportional to the number of changes.
+        If the snapshot was replaced from outside after `since`, there is no delta to
+        give: every entry is returned with 'full': True, and the client replaces its copy.
+        """
+        with self._lock:
+            self._refresh()
+            if since < self._reset:
+                return {'revision': self._revision, 'entries': list(self._sorted_entries()),
+                        'deleted': [], 'full': True}
+            entries, deleted = [], []
+            for key in reversed(self._log):
+                if self._log[key] <= since:
+                    break
+                if key in self._entries:
+                    entries.append(self._entries[key])
+                else:
+                    deleted.append(key)
+            entries.sort(key=date_key)
+            return {'revision': self._revision, 'entries': entries, 'deleted': sorted(deleted)}
+
+    # ── Writes ──
+
+    def _conflicts(self, changes, base, replace):
+        """Dates changed after `base` that this write would overwrite (or delete) unseen.
+
+        Walks the change log back to `base`, so the check costs O(changes since base).
+        Dates where the writer already sends the server's current entry don't conflict.
+        """
+        incoming = {date_key(e): e for e in changes}
+        entries, deleted = [], []
+        # Entries replaced from outside after `base` keep their old revs: check them all
+        floor = base if base >= self._reset else -1
+        for key in reversed(self._log):
+            if self._log[key] <= floor:
+                break
+            if key not in incoming and not replace:
+                continue
+            current = self._entries.get(key)
+            if current is None:
+                if key in incoming:
+                    deleted.append(key)
+            elif key not in incoming or not same_entry(current, incoming[key]):
+                entries.append(current)
+        entries.sort(key=date_key)
+        return entries, sorted(deleted)
+
+    def apply(self, changes, replace=False, base=None):
+        """Merge `changes` by date and journal the entries that actually changed.
+
+        With replace=True, dates missing from `changes` are deleted (full PUT semantics).
+        Entries that are already identical keep their rev. Returns (number changed,
+        dataset revision after the write), read under the lock so concurrent
+        writers each get their own revision.
+
+        With `base` (the revision the writer last saw), the write is conditional:
+        if any date it touches changed after `base`, nothing is written and
+        ConflictError lists those dates.
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        with self._lock, file_lock(self.lock_file):
+            # Catch up with other writers first so our revision is the newest
+            self._sync(repair=True)
+            if base is not None and base < self._revision:
+                entries, deleted = self._conflicts(changes, base, replace)
+                if entries or deleted:
+                    raise ConflictError(self._revision, entries, deleted)
+            revision = self._revision + 1
+            records = []
+            incoming = set()
+
+            for entry in changes:
+                key = date_key(entry)
+                incoming.add(key)
+                old = self._entries.get(key)
+                if old is not None and same_entry(old, entry):
+                    continue
+                entry = dict(entry)
+                entry['_rev'] = revision
+                records.append({'rev': revision, 'entry': entry})
+
+            if replace:
+                for key in sorted(self._entries.keys() - incoming):
+                    records.append({'rev': revision, 'deleted': key})
+
+            if records:
+                with phase('serialize'):
+                    payload = b''.join(dumps(r) + b'\n' for r in records)
+                with open(self.journal_file, 'ab') as f:
+                    with phase('write'):
+                        f.write(payload)
+                        f.flush()
+                    with phase('fsync'):
+                        os.fsync(f.fileno())
+                for record in records:
+                    self._apply_record(record)
+                self._offset += len(payload)
+                self._records += len(records)
+                if self._records >= self.compact_every:
+                    self._schedule_compaction()
+            return len(records), self._revision
+
+    def _schedule_compaction(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.compact_delay, self.compact)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot and truncate it."""
+        with self._lock:
+            self._timer = None
+            if not os.path.isdir(self.data_dir):
+                return
+            with file_lock(self.lock_file):
+                self._sync(repair=True)
+                if not self._records:
+                    return
+                write_data(self.data_file, self._sorted_entries())
+                self._write_meta()
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(0)
+                    os.fsync(f.fileno())
+                self._snapshot_mtime = self._stat(self.data_file)[0]
+                self._offset = 0
+                self._records = 0
@@ -0,0 +1,238 @@
+"""In-process metrics and an opt-in sampling profiler for the API server.
+
+Metrics are rendered in the Prometheus text exposition format at
+/api/metrics (no client library needed):
+
+    healthos_request_seconds{endpoint,method,status}   histogram of request latency
+    healthos_response_bytes{endpoint}                  histogram of response body sizes
+    healthos_phase_seconds{phase}                      histogram of time per I/O phase
+    healthos_payload_bytes{format,encoding}            gauge: last encoded /api/data body
+    healthos_entries, healthos_users_loaded            gauges, read at scrape time
+
+Phases are timed with `with phase('fsync'): ...` around the hot spots:
+read (file I/O in), parse (JSON decode), serialize (JSON encode), compress,
+write (file I/O out), fsync and rename.
+
+Every process keeps its own numbers; under gunicorn each scrape sees the
+worker that answered it, identified by the `pid` label on healthos_process_info.
+
+The profiler samples the stacks of threads that are handling a request every
+`interval` seconds and counts them in the folded format flame graph tools
+read ("frame;frame;frame count" per line).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Request latency buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Phase buckets reach further down: a small fsync or parse is well under a millisecond
+PHASE_BUCKETS = (0.0001, 0.00025, 0.0005) + LATENCY_BUCKETS
+# Body size buckets (bytes): 256 B to 16 MB in powers of 4
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(9))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}   # label tuple -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = dict(key)
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{format_labels({**labels, "le": format_value(bound)})} {count}')
+            lines.append(f'{self.name}_bucket{format_labels({**labels, "le": "+Inf"})} {values[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {values[-2]!r}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {values[-1]}')
+        return lines
+
+
+class Gauge:
+    """Last value per label set, or a callback read at scrape time."""
+
+    def __init__(self, name, help, read=None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        if self.read is not None:
+            lines.append(f'{self.name} {format_value(self.read())}')
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(dict(key))} {format_value(value)}')
+        return lines
+
+
+class ProcessInfo(Gauge):
+    """Always 1, labelled with the pid of the process rendering it.
+
+    The pid is read at scrape time: gunicorn workers are forked from a master
+    that may already have imported this module.
+    """
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge',
+                f'{self.name}{format_labels({"pid": os.getpid()})} 1']
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+PROCESS_INFO = registry.add(ProcessInfo('healthos_process_info', 'Process serving this scrape.'))
+REQUEST_SECONDS = registry.add(Histogram(
+    'healthos_request_seconds', 'Request latency by endpoint, method and status.', LATENCY_BUCKETS))
+RESPONSE_BYTES = registry.add(Histogram(
+    'healthos_response_bytes', 'Response body size by endpoint.', SIZE_BUCKETS))
+PHASE_SECONDS = registry.add(Histogram(
+    'healthos_phase_seconds', 'Time spent per I/O phase (read, parse, serialize, compress, write, fsync, rename).',
+    PHASE_BUCKETS))
+PAYLOAD_BYTES = registry.add(Gauge(
+    'healthos_payload_bytes', 'Size of the last encoded GET /api/data body by format and encoding.'))
+
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block into healthos_phase_seconds{phase=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - start, phase=name)
+
+
+# ─── Sampling profiler ───────────────────────────────────────
+
+class StackSampler:
+    """Counts the stacks of tracked threads, sampled every `interval` seconds by a daemon thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._threads = set()       # idents of threads currently handling a request
+        self._stacks = Counter()    # folded stack -> samples
+        self._samples = 0
+        self._stop = None
+        self.interval = None
+
+    @property
+    def running(self):
+        return self._stop is not None
+
+    def track(self, ident):
+        with self._lock:
+            self._threads.add(ident)
+
+    def untrack(self, ident):
+        with self._lock:
+            self._threads.discard(ident)
+
+    def start(self, interval=0.01):
+        self.stop()
+        self.interval = interval
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), name='healthos-sampler', daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _forked(self):
+        # The sampling thread doesn't survive a fork, and the parent's samples aren't ours
+        self._stop = None
+        self._threads = set()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self._samples += 1
+                for ident in self._threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._stacks[fold(frame)] += 1
+
+    def folded(self):
+        """'frame;frame;... count' lines, most sampled first."""
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+
+    def summary(self):
+        with self._lock:
+            return {'running': self.running, 'interval_ms': self.interval and self.interval * 1000,
+                    'samples': self._samples, 'stacks': len(self._stacks)}
+
+
+def fold(frame):
+    """One stack as 'outermost;...;innermost' of module:function frames."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+sampler = StackSampler()
+os.register_at_fork(after_in_child=sampler._forked)
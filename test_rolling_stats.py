@@ -0,0 +1,28 @@
+"""RollingStats tests: python -m pytest -q"""
+import pytest
+
+import rolling_stats
+
+
+def days(n):
+    return [{'date': f'2025-{1 + i // 28:02d}-{1 + i % 28:02d}', 'weight': 100 - i / 10,
+             'calories': 2000 + 10 * (i % 7)} for i in range(n)]
+
+
+def test_replacing_the_last_day_matches_a_rebuild():
+    entries = days(60)
+    stats = rolling_stats.build(entries[:-1])
+    # Log the weight first, then add the macros to the same day
+    stats.push_entry({'date': entries[-1]['date'], 'weight': 90.0}, replaceable=True)
+    stats.push_entry(entries[-1], replaceable=True)
+    assert stats.summary() == rolling_stats.build(entries).summary()
+
+
+def test_only_the_last_replaceable_day_can_be_pushed_again():
+    entries = days(10)
+    stats = rolling_stats.build(entries)
+    stats.push_entry(entries[-1])
+    with pytest.raises(ValueError):
+        stats.push_entry(entries[-1])
+    with pytest.raises(ValueError):
+        stats.push_entry(entries[0], replaceable=True)
@@ -0,0 +1,75 @@
+"""Storage and /api/data revision tests: python -m pytest -q"""
+import json
+import os
+import tempfile
+
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='healthos-test-'))
+
+import server  # noqa: E402  (reads DATA_DIR at import)
+from storage import DataStore  # noqa: E402
+
+
+def entries(n):
+    return [{'date': f'2025-{1 + i // 28:02d}-{1 + i % 28:02d}', 'weight': 100 - i / 10} for i in range(n)]
+
+
+def edit_by_hand(data_file, keep):
+    with open(data_file) as f:
+        data = json.load(f)
+    with open(data_file, 'w') as f:
+        json.dump(data[:keep], f)
+    # Make sure the stat differs even on filesystems with coarse timestamps
+    st = os.stat(data_file)
+    os.utime(data_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_hand_edit_changes_etag_and_body():
+    client = server.app.test_client()
+    headers = {server.USER_HEADER: 'handedit'}
+    assert client.put('/api/data', json=entries(120), headers=headers).status_code == 200
+    store = server.users.get('handedit').store
+    store.compact()
+
+    first = client.get('/api/data', headers=headers)
+    assert len(first.get_json()) == 120
+    etag = first.headers['ETag']
+    revision = int(first.headers['X-HealthOS-Revision'])
+
+    edit_by_hand(store.data_file, keep=20)
+
+    second = client.get('/api/data', headers={**headers, 'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != etag
+    assert len(second.get_json()) == 20
+    assert client.get('/api/health', headers=headers).get_json()['entries'] == 20
+
+    # A delta client can't be given a diff, so it gets the whole dataset
+    delta = client.get(f'/api/data?since={revision}', headers=headers).get_json()
+    assert delta['full'] and len(delta['entries']) == 20
+    assert delta['revision'] > revision
+
+
+def test_processes_agree_on_revision_after_hand_edit(tmp_path):
+    writer = DataStore(str(tmp_path))
+    writer.apply(entries(10))
+    writer.compact()
+    assert writer.revision == 1
+
+    edit_by_hand(writer.data_file, keep=5)
+    assert writer.revision == 2
+    # A process started after the edit loads the same revision from the meta file
+    assert DataStore(str(tmp_path)).revision == 2
+    assert len(DataStore(str(tmp_path))) == 5
+
+
+def test_compaction_keeps_revision(tmp_path):
+    store = DataStore(str(tmp_path))
+    store.apply(entries(10))
+    store.apply(entries(12))
+    store.compact()
+    assert store.revision == 2
+    other = DataStore(str(tmp_path))
+    assert other.revision == 2
+    delta = other.changes_since(1)
+    assert 'full' not in delta
+    assert [e['date'] for e in delta['entries']] == [e['date'] for e in entries(12)[10:]]